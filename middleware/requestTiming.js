@@ -0,0 +1,55 @@
+// middleware/requestTiming.js
+const { AsyncLocalStorage } = require("async_hooks");
+const crypto = require("crypto");
+
+// Holds the timing context of the request being handled, so that database
+// queries can be attributed to it without passing it through every call.
+const requestContext = new AsyncLocalStorage();
+
+/**
+ * Logs one `request_timing {...}` JSON line per request with its total time and
+ * the time spent in database queries. The request id is taken from the
+ * X-Request-Id header (or generated) and echoed back, so that client side timings
+ * can be joined with these lines (see scripts/correlate_timings.py).
+ */
+function requestTiming(req, res, next) {
+  const requestId = req.get("X-Request-Id") || crypto.randomUUID();
+  const start = process.hrtime.bigint();
+  const context = { requestId, dbMs: 0, dbQueries: 0 };
+  res.setHeader("X-Request-Id", requestId);
+
+  res.on("finish", () => {
+    const totalMs = Number(process.hrtime.bigint() - start) / 1e6;
+    console.log(
+      "request_timing " +
+        JSON.stringify({
+          request_id: requestId,
+          method: req.method,
+          path: req.path,
+          status: res.statusCode,
+          file_id: res.getHeader("file_id") ?? null,
+          view_index: res.getHeader("view_index") ?? null,
+          start: Date.now() - totalMs,
+          total_ms: totalMs,
+          db_ms: context.dbMs,
+          db_queries: context.dbQueries,
+        })
+    );
+  });
+
+  requestContext.run(context, next);
+}
+
+/**
+ * Sequelize logging callback (with `benchmark: true`) adding the query time to
+ * the request being handled.
+ */
+function recordQuery(sql, durationMs) {
+  const context = requestContext.getStore();
+  if (context && typeof durationMs === "number") {
+    context.dbMs += durationMs;
+    context.dbQueries += 1;
+  }
+}
+
+module.exports = { requestTiming, recordQuery, requestContext };
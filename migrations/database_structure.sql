@@ -48,6 +48,24 @@ CREATE TABLE `posts` (
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `posts_archive`
+--
+
+DROP TABLE IF EXISTS `posts_archive`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `posts_archive` (
+  `id` int(10) unsigned NOT NULL,
+  `file_id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `time` float DEFAULT NULL,
+  `certainty` tinyint(3) unsigned DEFAULT NULL,
+  `createdAt` datetime NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci ROW_FORMAT=COMPRESSED COMMENT='Posts moved out of posts by scripts/maintenance.py';
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `sequelizemeta`
 --
@@ -93,6 +111,7 @@ CREATE TABLE `UserViews` (
   `view_order` int(11) NOT NULL,
   PRIMARY KEY (`id`),
   KEY `user_id` (`user_id`),
+  UNIQUE KEY `user_view_order` (`user_id`,`view_order`),
   CONSTRAINT `fk_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
@@ -0,0 +1,65 @@
+-- SQLite version of database_structure.sql, used by the Python scripts when
+-- MySQLDatabase is created with dialect="sqlite". Keep both files in sync.
+
+DROP TABLE IF EXISTS `posts`;
+CREATE TABLE `posts` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `file_id` INTEGER NOT NULL,
+  `user_id` INTEGER NOT NULL,
+  `time` REAL DEFAULT NULL,
+  `certainty` INTEGER DEFAULT NULL,
+  `createdAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Posts moved out of posts by scripts/maintenance.py
+DROP TABLE IF EXISTS `posts_archive`;
+CREATE TABLE `posts_archive` (
+  `id` INTEGER PRIMARY KEY,
+  `file_id` INTEGER NOT NULL,
+  `user_id` INTEGER NOT NULL,
+  `time` REAL DEFAULT NULL,
+  `certainty` INTEGER DEFAULT NULL,
+  `createdAt` DATETIME NOT NULL
+);
+
+DROP TABLE IF EXISTS `sequelizemeta`;
+CREATE TABLE `sequelizemeta` (
+  `name` VARCHAR(255) NOT NULL PRIMARY KEY
+);
+
+DROP TABLE IF EXISTS `sessions`;
+CREATE TABLE `sessions` (
+  `id` VARCHAR(255) NOT NULL PRIMARY KEY,
+  `user_id` VARCHAR(255) DEFAULT NULL,
+  `expires_at` TIMESTAMP NULL DEFAULT NULL,
+  `created_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TABLE IF EXISTS `users`;
+CREATE TABLE `users` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `username` VARCHAR(255) NOT NULL UNIQUE,
+  `email` VARCHAR(255) DEFAULT NULL,
+  `password` VARCHAR(255) DEFAULT NULL,
+  `view_index` INTEGER DEFAULT 1,
+  `classified_file_count` INTEGER NOT NULL DEFAULT 0,
+  `createdAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updatedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Emulates MySQL's ON UPDATE CURRENT_TIMESTAMP
+CREATE TRIGGER `users_updatedAt` AFTER UPDATE ON `users`
+FOR EACH ROW WHEN NEW.`updatedAt` = OLD.`updatedAt`
+BEGIN
+  UPDATE `users` SET `updatedAt` = CURRENT_TIMESTAMP WHERE `id` = NEW.`id`;
+END;
+
+DROP TABLE IF EXISTS `UserViews`;
+CREATE TABLE `UserViews` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `user_id` INTEGER NOT NULL REFERENCES `users` (`id`) ON DELETE CASCADE,
+  `file_id` INTEGER NOT NULL,
+  `view_order` INTEGER NOT NULL,
+  UNIQUE (`user_id`, `view_order`)
+);
+CREATE INDEX `UserViews_user_id` ON `UserViews` (`user_id`);
@@ -7,9 +7,24 @@ const Sequelize = require("sequelize");
 const process = require("process");
 const basename = path.basename(__filename);
 const env = process.env.NODE_ENV || "development";
-const config = require(__dirname + "/../config/config.json")[env];
+const config = { ...require(__dirname + "/../config/config.json")[env] };
+const { recordQuery } = require("../middleware/requestTiming");
 const db = {};
 
+if (config.requestTiming) {
+  // Time every query and attribute it to the request being handled
+  const logging = config.logging;
+  config.benchmark = true;
+  config.logging = (sql, durationMs) => {
+    recordQuery(sql, durationMs);
+    if (typeof logging === "function") {
+      logging(sql, durationMs);
+    } else if (logging !== false) {
+      console.log(sql);
+    }
+  };
+}
+
 let sequelize;
 if (config.use_env_variable) {
   sequelize = new Sequelize(process.env[config.use_env_variable], config);
@@ -33,6 +33,7 @@ module.exports = (sequelize) => {
       sequelize,
       modelName: 'UserViews',
       timestamps: false,      
+      indexes: [{ unique: true, fields: ['user_id', 'view_order'] }],
     }
   );
 
@@ -0,0 +1,8 @@
+import numpy as np
+
+
+def segment_starts(keys: np.ndarray) -> np.ndarray:
+    """Boolean mask marking the first element of each run of equal sorted keys."""
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    return starts
@@ -2,8 +2,11 @@ import asyncio
 import io
 import logging
 import random
+import time
+import uuid
 import zlib
 from pathlib import Path
+from typing import Optional
 
 import httpx
 import pandas as pd
@@ -14,17 +17,57 @@ logging.basicConfig(
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
+# Sent with every request and logged by the server's requestTiming middleware
+REQUEST_ID_HEADER = "X-Request-Id"
+
+# Client side phases of a request: (name, first trace event, last trace event)
+PHASES = [
+    ("connect", "connection.connect_tcp.started", "connection.connect_tcp.complete"),
+    ("tls", "connection.start_tls.started", "connection.start_tls.complete"),
+    (
+        "send",
+        "http11.send_request_headers.started",
+        "http11.send_request_body.complete",
+    ),
+    (
+        "ttfb",
+        "http11.send_request_body.complete",
+        "http11.receive_response_headers.complete",
+    ),
+    (
+        "download",
+        "http11.receive_response_headers.complete",
+        "http11.receive_response_body.complete",
+    ),
+]
 
-class APIClient:
-    """A class to interact with a web API for classification tasks."""
 
-    def __init__(self, username, password, base_url="http://localhost:8000/"):
+class APIClient:
+    """
+    A class to interact with a web API for classification tasks.
+
+    Every request carries a unique X-Request-Id header. With record_timings set,
+    the duration of each phase of every request (see PHASES, plus the time waiting
+    for a connection and the decompression of fetched files) is appended to
+    timings, to be joined with the server's request_timing log lines by
+    correlate_timings.py.
+    """
+
+    def __init__(
+        self,
+        username,
+        password,
+        base_url="http://localhost:8000/",
+        record_timings=False,
+    ):
         self.username = username
         self.password = password
         self.base_url = base_url
         self.login_url = f"{self.base_url}login"
         self.data_url = f"{self.base_url}get_data/"
         self.post_url = f"{self.base_url}post"
+        self.record_timings = record_timings
+        self.timings = []
         self.client = httpx.AsyncClient()
 
     def classify_sync(self, n_classifications, login=False, speed=0.0):
@@ -56,15 +99,80 @@ class APIClient:
 
             data_response = await self.post_and_fetch_data(request_data)
 
+    async def replay(self, steps: pd.DataFrame, login=False, time_factor=1.0):
+        """
+        Replays a recorded session. Each step waits for the recorded gap (divided by
+        time_factor) before posting the recorded marked times and certainty.
+        """
+        if login:
+            await self.login()
+
+        data_response = await self.fetch_data()
+
+        for idx, step in enumerate(steps.itertuples(index=False)):
+            logging.debug(f"{self.username} replays {idx + 1}/{len(steps)}")
+            await asyncio.sleep(step.gap / time_factor)
+
+            request_data = {
+                "certainty": int(step.certainty),
+                "file_id_user": int(data_response.headers.get("file_id", 1)),
+                "time": list(step.time),
+                "view_index_user": int(data_response.headers.get("view_index", 1)),
+            }
+
+            data_response = await self.post_and_fetch_data(request_data)
+
+    async def _request(self, method, url, endpoint, **kwargs) -> httpx.Response:
+        """Sends a request with a request id, recording its timings if enabled."""
+        request_id = uuid.uuid4().hex
+        kwargs["headers"] = {REQUEST_ID_HEADER: request_id}
+        if not self.record_timings:
+            return await self.client.request(method, url, **kwargs)
+
+        marks = {}
+
+        async def trace(event_name, info):
+            marks[event_name] = time.perf_counter()
+
+        timing = {
+            "request_id": request_id,
+            "username": self.username,
+            "endpoint": endpoint,
+            "start": time.time(),
+            "status": None,
+        }
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(
+                method, url, extensions={"trace": trace}, **kwargs
+            )
+            timing["status"] = response.status_code
+            return response
+        finally:
+            end = time.perf_counter()
+            timing["total_ms"] = (end - start) * 1000
+            # Time until the first network event, waiting for a pooled connection
+            timing["queue_ms"] = (min(marks.values(), default=end) - start) * 1000
+            for phase, first, last in PHASES:
+                timing[f"{phase}_ms"] = (
+                    (marks[last] - marks[first]) * 1000
+                    if first in marks and last in marks
+                    else 0.0
+                )
+            timing["decompress_ms"] = 0.0
+            self.timings.append(timing)
+
     async def login(self):
-        login_page = await self.client.get(self.login_url)  # Await the get method
+        login_page = await self._request("GET", self.login_url, "login_page")
         if not login_page.is_success:
             raise Exception(
                 f"Failed to fetch login page: {login_page.status_code} {login_page.text}"
             )
 
-        response = await self.client.post(
+        response = await self._request(
+            "POST",
             self.login_url,
+            "login",
             json={
                 "username": self.username,
                 "password": self.password,
@@ -78,20 +186,24 @@ class APIClient:
         f"{self.username} logged in successfully!"
 
     async def fetch_data(self, token=None):
-        if token:
-            data_response = await self.client.get(
-                f"{self.data_url}{token}", cookies=dict(self.client.cookies)
-            )
-        else:
-            data_response = await self.client.get(
-                self.data_url, cookies=dict(self.client.cookies)
-            )
+        data_response = await self._request(
+            "GET",
+            f"{self.data_url}{token}" if token else self.data_url,
+            "get_data",
+            cookies=dict(self.client.cookies),
+        )
 
         if not data_response.is_success:
             raise Exception(
                 f"Failed to fetch data: {data_response.status_code} {data_response.text}"
             )
 
+        if self.record_timings:
+            # The browser inflates every file before plotting it
+            start = time.perf_counter()
+            zlib.decompress(data_response.content)
+            self.timings[-1]["decompress_ms"] = (time.perf_counter() - start) * 1000
+
         logging.info(
             f"{self.username} "
             f"successfully fetched file {data_response.headers.get('file_id', 1)} "
@@ -101,8 +213,12 @@ class APIClient:
         return data_response
 
     async def post_data(self, request_data):
-        response = await self.client.post(
-            self.post_url, json=request_data, cookies=dict(self.client.cookies)
+        response = await self._request(
+            "POST",
+            self.post_url,
+            "post",
+            json=request_data,
+            cookies=dict(self.client.cookies),
         )
         response.raise_for_status()
         response_data = response.json()
@@ -121,40 +237,9 @@ class APIClient:
 
 
 def parse_args():
-    import argparse
-
-    parser = argparse.ArgumentParser(description="Classify images using the HTD API.")
-    parser.add_argument(
-        "--user_table_path",
-        type=str,
-        default=Path(__file__).parent / "output/users.csv",
-        help="Path to the users table.",
-    )
-    parser.add_argument(
-        "--base_url",
-        type=str,
-        default="http://localhost:8000/",
-        help="Base URL of the API.",
-    )
-    parser.add_argument(
-        "--speed",
-        type=float,
-        default=0.0,
-        help="Speed of classification in seconds.",
-    )
-    parser.add_argument(
-        "--randomize_speed",
-        action="store_true",
-        help="Randomize the classification speed.",
-    )
-    parser.add_argument(
-        "--n_classifications",
-        type=int,
-        default=5,
-        help="Number of classifications to perform.",
-    )
-
-    return parser.parse_args()
+    from htd import build_parser
+
+    return build_parser("load-test").parse_args()
 
 
 async def main(
@@ -163,9 +248,11 @@ async def main(
     n_classifications,
     speed,
     randomize_speed,
+    timings_path: Optional[Path] = None,
 ):
     df = pd.read_csv(Path(user_table_path))
 
+    clients = []
     tasks = []
     for _, row in df.iterrows():
         username = row["username"]
@@ -178,7 +265,13 @@ async def main(
                 f"{username}: classifies with a randomized speed of {speed:.2f} seconds."
             )
 
-        client = APIClient(username, password, base_url=base_url)
+        client = APIClient(
+            username,
+            password,
+            base_url=base_url,
+            record_timings=timings_path is not None,
+        )
+        clients.append(client)
         task = client.classify(
             n_classifications,
             login=True,
@@ -186,17 +279,37 @@ async def main(
         )
         tasks.append(task)
 
-    await asyncio.gather(*tasks)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if timings_path is not None:
+            timings = pd.DataFrame(
+                [timing for client in clients for timing in client.timings]
+            )
+            timings.to_json(timings_path, orient="records", lines=True)
+            logging.info(f"Saved {len(timings)} request timings to {timings_path}.")
 
 
 if __name__ == "__main__":
+    from sampling_profiler import SamplingProfiler
+
     args = parse_args()
-    asyncio.run(
-        main(
-            user_table_path=args.user_table_path,
-            n_classifications=args.n_classifications,
-            speed=args.speed,
-            randomize_speed=args.randomize_speed,
-            base_url=args.base_url,
+    profiler = SamplingProfiler() if args.profile else None
+    if profiler is not None:
+        profiler.start()
+    try:
+        asyncio.run(
+            main(
+                user_table_path=args.user_table_path,
+                n_classifications=args.n_classifications,
+                speed=args.speed,
+                randomize_speed=args.randomize_speed,
+                base_url=args.base_url,
+                timings_path=args.timings,
+            )
         )
-    )
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(args.profile)
+            profiler.log_top()
@@ -0,0 +1,271 @@
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+# The database module imports pandas and SQLAlchemy, which would slow down the
+# startup of the htd command that imports this module for its arguments
+if TYPE_CHECKING:
+    from mysql_database import MySQLDatabase
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+BENCHMARK_DIR = Path(__file__).parent / "output" / "benchmarks"
+
+SCALES = {
+    "small": {"users": 50, "images": 1000, "views": 5, "batches": 5},
+    "medium": {"users": 500, "images": 20000, "views": 5, "batches": 10},
+    "large": {"users": 2000, "images": 200000, "views": 10, "batches": 20},
+}
+
+
+def _database(n_users: int = 0) -> "MySQLDatabase":
+    """
+    Fresh in-memory SQLite stand-in with n_users users. Passwords are not hashed,
+    so that only the generate_users benchmark pays for bcrypt.
+    """
+    from mysql_database import MySQLDatabase
+
+    db = MySQLDatabase(dialect="sqlite", storage=":memory:")
+    db.reset()
+    if n_users:
+        db.insert_records(
+            "users",
+            [(f"user{i}", "") for i in range(1, n_users + 1)],
+            columns=["username", "password"],
+        )
+    return db
+
+
+# Each benchmark prepares its inputs outside of the measurement and returns a
+# function that runs the measured code and returns the number of rows it produced.
+
+
+def bench_create_user_view_mapping(scale: dict) -> Callable[[], int]:
+    from create_user_views import create_user_view_mapping
+
+    db = _database(scale["users"])
+    return lambda: len(create_user_view_mapping(db, scale["images"], scale["views"]))
+
+
+def bench_create_user_view_mapping_with_transits(scale: dict) -> Callable[[], int]:
+    from create_user_views import create_user_view_mapping_with_and_without_transits
+
+    db = _database(scale["users"])
+    return lambda: len(
+        create_user_view_mapping_with_and_without_transits(
+            db, scale["images"], scale["views"]
+        )
+    )
+
+
+def bench_assign_batches_to_users(scale: dict) -> Callable[[], int]:
+    from create_user_views_batch import assign_batches_to_users
+
+    db = _database(scale["users"])
+    return lambda: len(assign_batches_to_users(db, scale["images"], scale["batches"]))
+
+
+def bench_generate_users(scale: dict) -> Callable[[], int]:
+    from user_generation import generate_users
+
+    db = _database()
+    return lambda: len(generate_users(db, scale["users"], executor="thread"))
+
+
+def bench_insert_records(scale: dict) -> Callable[[], int]:
+    from create_user_views import create_user_view_mapping
+
+    db = _database(scale["users"])
+    records = create_user_view_mapping(db, scale["images"], scale["views"])
+    records = records[["user_id", "file_id", "view_order"]].values.tolist()
+
+    def run() -> int:
+        if not db.insert_records(
+            "UserViews", records, columns=["user_id", "file_id", "view_order"]
+        ):
+            raise RuntimeError("Error inserting the records.")
+        return len(records)
+
+    return run
+
+
+BENCHMARKS = {
+    "create_user_view_mapping": bench_create_user_view_mapping,
+    "create_user_view_mapping_with_transits": (
+        bench_create_user_view_mapping_with_transits
+    ),
+    "assign_batches_to_users": bench_assign_batches_to_users,
+    "generate_users": bench_generate_users,
+    "insert_records": bench_insert_records,
+}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(name: str, scale: dict, repeat: int = 3, trace: bool = True) -> dict:
+    """
+    Runs one benchmark repeat times on fresh databases and reports the fastest run.
+    With trace set, one extra run measures the peak of Python allocations with
+    tracemalloc, which is kept out of the timed runs as it slows them down.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    seconds = []
+    for _ in range(repeat):
+        run = BENCHMARKS[name](scale)
+        gc.collect()
+        start = time.perf_counter()
+        rows = run()
+        seconds.append(time.perf_counter() - start)
+
+    result = {
+        "scale": scale,
+        "rows": rows,
+        "seconds": min(seconds),
+        "seconds_all": seconds,
+        "rows_per_second": rows / min(seconds) if min(seconds) > 0 else None,
+        "tracemalloc_peak_mb": None,
+    }
+    if trace:
+        run = BENCHMARKS[name](scale)
+        gc.collect()
+        tracemalloc.start()
+        run()
+        result["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def run_benchmarks(
+    names: List[str], scale: dict, repeat: int = 3, trace: bool = True
+) -> dict:
+    """
+    Runs each benchmark in a fresh process, so that its peak RSS is not inflated
+    by the benchmarks before it.
+    """
+    results = {}
+    for name in names:
+        logging.info(f"Running {name} at {scale}.")
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as pool:
+            results[name] = pool.submit(
+                run_benchmark, name, scale, repeat, trace
+            ).result()
+        result = results[name]
+        logging.info(
+            f"{name}: {result['seconds']:.3f}s, {result['rows_per_second'] or 0:.0f} "
+            f"rows/s, peak RSS {result['peak_rss_mb'] or float('nan'):.0f} MB, "
+            f"tracemalloc peak {result['tracemalloc_peak_mb'] or float('nan'):.1f} MB."
+        )
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def compare_to_baseline(report: dict, baseline: dict, threshold: float = 0.2) -> list:
+    """
+    Lists the benchmarks whose time or memory peaks grew by more than threshold
+    (relative) compared to the baseline. Benchmarks run at a different scale than
+    in the baseline are skipped.
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if base["scale"] != result["scale"]:
+            logging.warning(f"{name}: baseline was run at {base['scale']}, skipping.")
+            continue
+        for metric in ["seconds", "peak_rss_mb", "tracemalloc_peak_mb"]:
+            if not result.get(metric) or not base.get(metric):
+                continue
+            ratio = result[metric] / base[metric]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "metric": metric,
+                        "baseline": base[metric],
+                        "value": result[metric],
+                        "ratio": ratio,
+                    }
+                )
+    return regressions
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python benchmark.py --scale medium --repeat 3 --threshold 0.2
+    >>> python benchmark.py --benchmarks insert_records --images 100000 --save_baseline
+    """
+    from htd import build_parser
+
+    return build_parser("benchmark").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    scale = dict(SCALES[args.scale])
+    for parameter in scale:
+        if getattr(args, parameter) is not None:
+            scale[parameter] = getattr(args, parameter)
+
+    report = run_benchmarks(
+        args.benchmarks, scale, repeat=args.repeat, trace=not args.no_tracemalloc
+    )
+
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    output = args.output or BENCHMARK_DIR / f"{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    logging.info(f"Saved results to {output}.")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        with open(baseline_path, "w") as file:
+            json.dump(report, file, indent=2)
+        logging.info(f"Saved baseline to {baseline_path}.")
+    elif baseline_path.exists():
+        with open(baseline_path) as file:
+            regressions = compare_to_baseline(report, json.load(file), args.threshold)
+        for regression in regressions:
+            logging.error(
+                f"Regression in {regression['benchmark']}: {regression['metric']} "
+                f"{regression['baseline']:.3f} -> {regression['value']:.3f} "
+                f"({regression['ratio']:.2f}x)."
+            )
+        if regressions:
+            sys.exit(1)
+        logging.info(f"No regressions above {args.threshold:.0%} against the baseline.")
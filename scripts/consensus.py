@@ -0,0 +1,193 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from array_utils import segment_starts
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+CANDIDATE_COLUMNS = [
+    "file_id",
+    "time",
+    "time_std",
+    "support",
+    "n_classifiers",
+    "support_fraction",
+    "weight",
+    "mean_certainty",
+]
+
+
+def load_posts(db: MySQLDatabase) -> pd.DataFrame:
+    """Loads the columns needed for the consensus of all posts, archived ones too."""
+    posts = db.query_to_dataframe(
+        f"SELECT file_id, user_id, time, certainty FROM {db.all_posts()}"
+    )
+    if posts is None:
+        raise ValueError("Error loading the posts table.")
+    return posts
+
+
+def count_classifiers(file_ids: np.ndarray, user_ids: np.ndarray) -> pd.Series:
+    """Number of distinct users that submitted a post for each file."""
+    if len(file_ids) == 0:
+        return pd.Series(dtype=np.int64, name="n_classifiers")
+    n_user_ids = user_ids.max() + 1
+    pairs = np.unique(file_ids * n_user_ids + user_ids)
+    distinct_files, counts = np.unique(pairs // n_user_ids, return_counts=True)
+    return pd.Series(counts, index=distinct_files, name="n_classifiers")
+
+
+def cluster_transit_times(
+    file_ids: np.ndarray,
+    user_ids: np.ndarray,
+    times: np.ndarray,
+    certainties: np.ndarray,
+    tolerance: float = 0.1,
+    min_support: int = 1,
+) -> pd.DataFrame:
+    """
+    Clusters the transit times marked by different users on the same file.
+
+    Times of a file are sorted and a new cluster starts wherever two consecutive
+    times are more than tolerance apart. Each cluster is reduced to a consensus time
+    (weighted by certainty), its spread and the number of distinct users supporting
+    it. Everything is computed with sorting and segment reductions over all files
+    at once, so there is no Python loop over files.
+
+    Posts without a time (a user saw no transit) count towards n_classifiers but do
+    not form clusters.
+    """
+    file_ids = np.asarray(file_ids, dtype=np.int64)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    times = np.asarray(times, dtype=np.float64)
+    certainties = np.nan_to_num(np.asarray(certainties, dtype=np.float64), nan=1.0)
+
+    n_classifiers = count_classifiers(file_ids, user_ids)
+
+    marked = ~np.isnan(times)
+    file_ids, user_ids = file_ids[marked], user_ids[marked]
+    times, certainties = times[marked], certainties[marked]
+    if len(times) == 0:
+        return pd.DataFrame(columns=CANDIDATE_COLUMNS)
+
+    order = np.lexsort((times, file_ids))
+    file_ids, user_ids = file_ids[order], user_ids[order]
+    times, certainties = times[order], certainties[order]
+
+    # A cluster starts with every new file and wherever the gap exceeds tolerance
+    new_cluster = segment_starts(file_ids)
+    new_cluster[1:] |= np.diff(times) > tolerance
+    cluster_ids = np.cumsum(new_cluster) - 1
+    starts = np.flatnonzero(new_cluster)
+
+    weight = np.add.reduceat(certainties, starts)
+    consensus_time = np.add.reduceat(certainties * times, starts) / weight
+    deviation = times - consensus_time[cluster_ids]
+    time_std = np.sqrt(np.add.reduceat(certainties * deviation**2, starts) / weight)
+    n_marks = np.diff(np.append(starts, len(times)))
+
+    # Support counts distinct users, a user marking twice within a cluster counts once
+    user_order = np.lexsort((user_ids, cluster_ids))
+    first_mark = segment_starts(
+        cluster_ids[user_order] * (user_ids.max() + 1) + user_ids[user_order]
+    )
+    support = np.bincount(cluster_ids[user_order][first_mark], minlength=len(starts))
+
+    candidates = pd.DataFrame(
+        {
+            "file_id": file_ids[starts],
+            "time": consensus_time,
+            "time_std": time_std,
+            "support": support,
+            "n_classifiers": n_classifiers.loc[file_ids[starts]].to_numpy(),
+            "weight": weight,
+            "mean_certainty": weight / n_marks,
+        }
+    )
+    candidates["support_fraction"] = candidates["support"] / candidates["n_classifiers"]
+    candidates = candidates[candidates["support"] >= min_support]
+
+    return candidates[CANDIDATE_COLUMNS].reset_index(drop=True)
+
+
+def _cluster_shard(args) -> pd.DataFrame:
+    """Unpacks the arguments of a shard for the process pool."""
+    return cluster_transit_times(*args)
+
+
+def compute_consensus(
+    posts: pd.DataFrame,
+    tolerance: float = 0.1,
+    min_support: int = 1,
+    n_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Computes the consensus transit candidates of all files.
+
+    With n_workers set, the posts are sharded by file_id and the shards are
+    clustered in a process pool. Since clusters never span files, the result is
+    the same as in the single process mode.
+    """
+    columns = [
+        posts["file_id"].to_numpy(dtype=np.int64),
+        posts["user_id"].to_numpy(dtype=np.int64),
+        posts["time"].to_numpy(dtype=np.float64, na_value=np.nan),
+        posts["certainty"].to_numpy(dtype=np.float64, na_value=np.nan),
+    ]
+
+    if not n_workers or n_workers <= 1:
+        candidates = cluster_transit_times(*columns, tolerance, min_support)
+    else:
+        shard_ids = columns[0] % n_workers
+        shards = [
+            [column[shard_ids == shard] for column in columns]
+            + [tolerance, min_support]
+            for shard in range(n_workers)
+        ]
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            candidates = pd.concat(
+                list(pool.map(_cluster_shard, shards)), ignore_index=True
+            )
+
+    candidates = candidates.sort_values(["file_id", "time"], ignore_index=True)
+    logging.info(
+        f"Found {len(candidates)} transit candidates in "
+        f"{candidates['file_id'].nunique()} files from {len(posts)} posts."
+    )
+    return candidates
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python consensus.py --tolerance 0.05 --min_support 3 --n_workers 4
+    """
+    from htd import build_parser
+
+    return build_parser("consensus").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.input is not None:
+        posts = pd.read_csv(args.input)
+    else:
+        posts = load_posts(MySQLDatabase.from_config(mode=args.mode))
+
+    candidates = compute_consensus(
+        posts,
+        tolerance=args.tolerance,
+        min_support=args.min_support,
+        n_workers=args.n_workers,
+    )
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    candidates.to_csv(args.output, index=False)
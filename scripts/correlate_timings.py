@@ -0,0 +1,134 @@
+import json
+import logging
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+SERVER_LOG_PREFIX = "request_timing "
+
+# Components a request's client side total is split into by correlate
+COMPONENTS = [
+    "client_queue_ms",
+    "client_connect_ms",
+    "client_send_ms",
+    "network_ms",
+    "server_app_ms",
+    "server_db_ms",
+    "client_decompress_ms",
+]
+
+
+def load_client_timings(paths: List[Path]) -> pd.DataFrame:
+    """Request timings written by async_api_client.py --timings."""
+    return pd.concat(
+        [pd.read_json(path, orient="records", lines=True) for path in paths],
+        ignore_index=True,
+    )
+
+
+def load_server_timings(path: Path) -> pd.DataFrame:
+    """
+    request_timing lines logged by the server's requestTiming middleware. Other
+    lines of the log are ignored, so the whole server output can be passed.
+    """
+    records = []
+    with open(path) as file:
+        for line in file:
+            position = line.find(SERVER_LOG_PREFIX)
+            if position < 0:
+                continue
+            try:
+                records.append(json.loads(line[position + len(SERVER_LOG_PREFIX) :]))
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping malformed line: {line.strip()}")
+    return pd.DataFrame(records)
+
+
+def correlate(client: pd.DataFrame, server: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joins client and server timings on the request id and splits the client's
+    total time of each request into COMPONENTS. The server's time runs from the
+    arrival of the request to the response being handed to the OS, so the rest of
+    the time between sending the request and receiving the last byte is network.
+    """
+    joined = client.merge(
+        server[["request_id", "path", "total_ms", "db_ms", "db_queries"]].rename(
+            columns={"total_ms": "server_total_ms"}
+        ),
+        on="request_id",
+        how="inner",
+    )
+    n_unmatched = len(client) - len(joined)
+    if n_unmatched:
+        logging.warning(
+            f"{n_unmatched} of {len(client)} client requests have no server timing."
+        )
+
+    joined["client_queue_ms"] = joined["queue_ms"]
+    joined["client_connect_ms"] = joined["connect_ms"] + joined["tls_ms"]
+    joined["client_send_ms"] = joined["send_ms"]
+    joined["server_db_ms"] = joined["db_ms"]
+    joined["server_app_ms"] = joined["server_total_ms"] - joined["db_ms"]
+    joined["network_ms"] = np.maximum(
+        joined["ttfb_ms"] + joined["download_ms"] - joined["server_total_ms"], 0
+    )
+    joined["client_decompress_ms"] = joined["decompress_ms"]
+    return joined
+
+
+def summarize(correlated: pd.DataFrame) -> pd.DataFrame:
+    """Percentiles of the components and their share of the total per endpoint."""
+    rows = []
+    for endpoint, group in correlated.groupby("endpoint"):
+        total = group["total_ms"].sum() + group["client_decompress_ms"].sum()
+        for component in ["total_ms", *COMPONENTS]:
+            values = group[component]
+            rows.append(
+                {
+                    "endpoint": endpoint,
+                    "component": component,
+                    "requests": len(group),
+                    "p50_ms": values.quantile(0.5),
+                    "p90_ms": values.quantile(0.9),
+                    "p99_ms": values.quantile(0.99),
+                    "share": values.sum() / total if total else np.nan,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python correlate_timings.py --client timings.jsonl --server_log server.log
+    """
+    from htd import build_parser
+
+    return build_parser("correlate").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = load_client_timings(args.client)
+    server = load_server_timings(args.server_log)
+    logging.info(
+        f"Loaded {len(client)} client and {len(server)} server request timings."
+    )
+    if client.empty or server.empty:
+        raise SystemExit("No timings to correlate.")
+
+    correlated = correlate(client, server)
+    correlated.to_csv(args.output, index=False)
+    logging.info(f"Saved {len(correlated)} correlated requests to {args.output}.")
+
+    summary = summarize(correlated)
+    with pd.option_context("display.width", 120, "display.max_rows", None):
+        logging.info(f"Request time breakdown:\n{summary.round(3).to_string()}")
@@ -1,10 +1,12 @@
+import hashlib
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import numpy as np
 import pandas as pd
 from mysql_database import MySQLDatabase
+from setup_checkpoint import SetupCheckpoint, insert_in_chunks
 
 logging.basicConfig(
     level=logging.INFO,
@@ -66,22 +68,42 @@ def create_user_view_mapping_with_and_without_transits(
     """
     Generate a DataFrame mapping user IDs to image IDs for classification tasks,
     ensuring that each image is viewed by a specific number of different users,
-    and that each participant who sees image i also sees image n_images + i
-    with a delay of 20 images.
-
-    The effective median delay distance is 2 * delay - 1. That is for a delay of 10,
-    the distance between the two images is 19, except for some of the first and last images.
+    and that each participant who sees image i also sees image n_images + i.
+    The transit twins are shifted by `delay` rows of the mapping, see
+    `add_transit_pairs` for the resulting distance between the two views.
     """
     df = create_user_view_mapping(db, n_images, n_views, shuffle_images, rng).drop(
         columns=["view_order"]
     )
 
+    combined_df = add_transit_pairs(df, n_images, delay, rng)
+    combined_df["view_order"] = combined_df.groupby("user_id").cumcount() + 1
+
+    return combined_df
+
+
+def add_transit_pairs(
+    df: pd.DataFrame,
+    n_images: int,
+    delay: int,
+    rng: np.random.RandomState = np.random.RandomState(42),
+) -> pd.DataFrame:
+    """
+    Interleave each (user_id, file_id) assignment with its transit twin
+    file_id + n_images, shifted by `delay` assignments.
+
+    The shift counts rows of the whole mapping, in which the users are interleaved.
+    Per user, the two views of a pair are therefore about 2 * delay / n_users views
+    apart (so mostly adjacent for many users), and 2 * delay - 1 only with a single
+    user.
+    """
+    df = df.reset_index(drop=True)
     transit_df = df.copy()
     transit_df["file_id"] += n_images
     transit_df = transit_df.reindex(index=np.roll(df.index, -delay))
 
     # Pairwise shuffle between df and transit_df to break regularity
-    mask = np.random.rand(len(df)) < 0.5
+    mask = rng.rand(len(df)) < 0.5
     df.iloc[mask], transit_df.iloc[mask] = (
         transit_df.iloc[mask].copy(),
         df.iloc[mask].copy(),
@@ -91,29 +113,246 @@ def create_user_view_mapping_with_and_without_transits(
     combined_df.iloc[0::2, :] = df
     combined_df.iloc[1::2, :] = transit_df
 
-    combined_df["view_order"] = combined_df.groupby("user_id").cumcount() + 1
-
     return combined_df
 
 
-def insert_dataframe_into_database(db: MySQLDatabase, records):
-    records = [tuple(row) for row in records.to_numpy().astype(int).tolist()]
-    db.insert_records(
-        "UserViews", records, columns=["user_id", "file_id", "view_order"]
+def fetch_view_state(db: MySQLDatabase, n_images: int) -> pd.Series:
+    """
+    Fetches the number of views per base image (file ids 1..n_images) with a single
+    aggregate query. Images without any view are reported with a count of zero.
+    """
+    results = db.query(
+        f"SELECT file_id, COUNT(*) FROM UserViews "
+        f"WHERE file_id <= {int(n_images)} GROUP BY file_id"
+    )
+    if results is None:
+        raise ValueError("Error loading the view counts from UserViews.")
+
+    view_counts = pd.Series(0, index=np.arange(1, n_images + 1), name="n_views")
+    if results:
+        file_ids, counts = np.array(results, dtype=np.int64).T
+        view_counts.loc[file_ids] = counts
+    return view_counts
+
+
+def fetch_max_view_orders(db: MySQLDatabase, user_ids: List[int]) -> pd.Series:
+    """Fetches the highest assigned view_order of the given users (0 if none)."""
+    max_view_orders = pd.Series(0, index=np.asarray(user_ids), name="view_order")
+    if len(user_ids) == 0:
+        return max_view_orders
+
+    id_list = ", ".join(str(int(user_id)) for user_id in user_ids)
+    results = db.query(
+        f"SELECT user_id, MAX(view_order) FROM UserViews "
+        f"WHERE user_id IN ({id_list}) GROUP BY user_id"
+    )
+    if results is None:
+        raise ValueError("Error loading the view orders from UserViews.")
+
+    if results:
+        found_ids, orders = np.array(results, dtype=np.int64).T
+        max_view_orders.loc[found_ids] = orders
+    return max_view_orders
+
+
+def fetch_users_without_views(db: MySQLDatabase) -> List[int]:
+    """Fetches the IDs of all users that have no UserViews entries yet."""
+    results = db.query(
+        "SELECT id FROM users WHERE id NOT IN (SELECT DISTINCT user_id FROM UserViews)"
+    )
+    return sorted([row[0] for row in results]) if results else []
+
+
+def level_view_counts(
+    view_counts: pd.Series, n_assignments: int, max_per_file: Optional[int] = None
+) -> np.ndarray:
+    """
+    Distributes n_assignments new views over the images such that the view counts
+    become as even as possible, topping up the least viewed images first. No image
+    receives more than max_per_file new views, so fewer views are returned if the
+    images cannot take all of them.
+
+    Returns the file ids of the new views, sorted by file id.
+    """
+    if n_assignments <= 0 or view_counts.empty:
+        return np.array([], dtype=np.int64)
+
+    file_ids = view_counts.index.to_numpy()
+    counts = view_counts.to_numpy()
+    cap = n_assignments if max_per_file is None else max_per_file
+
+    def extra_views(level: int) -> np.ndarray:
+        return np.clip(level - counts, 0, cap)
+
+    # Highest level reachable with the available assignments (water filling)
+    low, high = int(counts.min()), int(counts.max()) + cap
+    while low < high:
+        level = (low + high + 1) // 2
+        if extra_views(level).sum() <= n_assignments:
+            low = level
+        else:
+            high = level - 1
+
+    extra = extra_views(low)
+    remainder = n_assignments - extra.sum()
+    candidates = np.flatnonzero((counts <= low) & (extra < cap))[:remainder]
+    extra[candidates] += 1
+    return np.repeat(file_ids, extra)
+
+
+def create_user_view_extension(
+    db: MySQLDatabase,
+    n_images: int,
+    n_views: int,
+    user_ids: Optional[List[int]] = None,
+    views_per_user: Optional[int] = None,
+    shuffle_images=True,
+    rng: np.random.RandomState = np.random.RandomState(42),
+    delay: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Generate UserViews entries for users added after the initial mapping was created,
+    without touching the existing assignments.
+
+    The current assignment state is read with aggregate queries only, so the cost
+    scales with the number of new users rather than with the size of the study.
+    New views go to the least viewed images first, so that images below n_views
+    are topped up before the load is spread evenly across all images. The new
+    views of an image go to distinct users, so an image receives at most one new
+    view per extended user. If delay is given, every user who sees image i also
+    sees its transit twin n_images + i (see `add_transit_pairs`); as in
+    `create_user_view_mapping_with_and_without_transits`, the distance between
+    the two views of a user is not controlled.
+
+    By default, all users without any UserViews entry are extended, each receiving
+    the average number of images per user of the existing mapping. Passing user_ids
+    appends to the sequences of those users instead.
+    """
+    if user_ids is None:
+        user_ids = fetch_users_without_views(db)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    if len(user_ids) == 0:
+        logging.info("No users to extend.")
+        return pd.DataFrame(columns=["user_id", "file_id", "view_order"], dtype=int)
+
+    view_counts = fetch_view_state(db, n_images)
+    if views_per_user is None:
+        n_existing_users = db.query("SELECT COUNT(DISTINCT user_id) FROM UserViews")
+        n_existing_users = n_existing_users[0][0] if n_existing_users else 0
+        total_views = int(view_counts.sum())
+        if n_existing_users > 0 and total_views > 0:
+            views_per_user = int(np.ceil(total_views / n_existing_users))
+        else:
+            views_per_user = int(np.ceil(n_images * n_views / len(user_ids)))
+    views_per_user = min(views_per_user, n_images)
+
+    new_file_ids = level_view_counts(
+        view_counts, views_per_user * len(user_ids), max_per_file=len(user_ids)
+    )
+    # The views of a file are consecutive and at most len(user_ids) long, so
+    # assigning the users round robin gives them to distinct users
+    df = pd.DataFrame(
+        {
+            "user_id": user_ids[np.arange(len(new_file_ids)) % len(user_ids)],
+            "file_id": new_file_ids,
+        }
+    )
+    if shuffle_images:
+        df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+    if delay is not None:
+        df = add_transit_pairs(df, n_images, delay, rng)
+
+    offsets = fetch_max_view_orders(db, user_ids.tolist())
+    df["view_order"] = (
+        df.groupby("user_id").cumcount() + 1 + offsets.loc[df["user_id"]].to_numpy()
+    )
+    logging.info(
+        f"Extending UserViews by {len(df)} entries for {len(user_ids)} users "
+        f"({views_per_user} images per user)."
+    )
+
+    return df[["user_id", "file_id", "view_order"]]
+
+
+def insert_dataframe_into_database(
+    db: MySQLDatabase,
+    records: pd.DataFrame,
+    chunk_size: Optional[int] = None,
+    checkpoint: Optional[SetupCheckpoint] = None,
+):
+    """
+    Inserts user views in chunks of chunk_size rows (all at once if None). Existing
+    (user_id, view_order) entries are kept as they are, so re-running is a no-op.
+    """
+    columns = ["user_id", "file_id", "view_order"]
+    records = records[columns].to_numpy().astype(int)
+    insert_in_chunks(
+        db,
+        "UserViews",
+        len(records),
+        lambda chunk: [tuple(row) for row in records[chunk].tolist()],
+        columns=columns,
+        chunk_size=chunk_size or max(len(records), 1),
+        checkpoint=checkpoint,
     )
 
 
 def insert_user_image_views(
-    db: MySQLDatabase, n_images: int, n_views: int, delay: Optional[int] = None
+    db: MySQLDatabase,
+    n_images: int,
+    n_views: int,
+    delay: Optional[int] = None,
+    seed: int = 42,
+    chunk_size: Optional[int] = None,
+    resume: bool = False,
 ):
+    """
+    Creates and inserts the user view mapping. With resume set, progress is tracked
+    in a local checkpoint and an interrupted run continues after the last committed
+    chunk; the mapping is regenerated identically from the stored seed. As the
+    mapping also depends on the users, the checkpoint stores a digest of their IDs
+    and refuses to resume after users were added or removed.
+    """
+    checkpoint = None
+    if resume:
+        user_ids = db.fetch_user_ids()
+        checkpoint = SetupCheckpoint.load_or_create(
+            "views",
+            parameters={
+                "n_images": n_images,
+                "n_views": n_views,
+                "delay": delay,
+                "seed": seed,
+                "chunk_size": chunk_size,
+                "n_users": len(user_ids),
+                "user_ids_sha256": hashlib.sha256(
+                    ",".join(map(str, user_ids)).encode()
+                ).hexdigest(),
+            },
+            db=db,
+            table="UserViews",
+        )
+
+    rng = np.random.RandomState(seed)
     if delay is not None:
         records = create_user_view_mapping_with_and_without_transits(
-            db, n_images, n_views, delay=delay
+            db, n_images, n_views, rng=rng, delay=delay
         )
     else:
-        records = create_user_view_mapping(db, n_images, n_views)
+        records = create_user_view_mapping(db, n_images, n_views, rng=rng)
+
+    insert_dataframe_into_database(
+        db, records, chunk_size=chunk_size, checkpoint=checkpoint
+    )
 
-    insert_dataframe_into_database(db, records)
+
+def extend_user_image_views(
+    db: MySQLDatabase, n_images: int, n_views: int, delay: Optional[int] = None
+):
+    records = create_user_view_extension(db, n_images, n_views, delay=delay)
+    if len(records) > 0:
+        insert_dataframe_into_database(db, records)
 
 
 def parse_args():
@@ -122,37 +361,31 @@ def parse_args():
     -------
     >>> python create_user_views.py --n_views 10 --delay 3 --n_images 20 --mode production
     """
-    import argparse
+    from htd import build_parser
 
-    parser = argparse.ArgumentParser(
-        description="Create user image views for classification tasks."
-    )
-    parser.add_argument(
-        "--n_views", type=int, default=5, help="Number of views per image."
-    )
-    parser.add_argument(
-        "--delay", type=int, default=5, help="Delay for transit images."
-    )
-    parser.add_argument(
-        "--n_images", type=int, default=count_files(), help="Number of images."
-    )
-    parser.add_argument(
-        "--mode",
-        type=str,
-        default="development",
-        help="Config mode (development/production).",
-    )
-
-    return parser.parse_args()
+    return build_parser("views").parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
+    if args.n_images is None:
+        args.n_images = count_files()
     logging.info(
         f"Creating user image views with {args.n_images} images, {args.n_views} views per image, "
         f"and a delay of {args.delay}."
     )
     db = MySQLDatabase.from_config(mode=args.mode)
-    insert_user_image_views(
-        db, n_images=args.n_images, n_views=args.n_views, delay=args.delay
-    )
+    if args.extend:
+        extend_user_image_views(
+            db, n_images=args.n_images, n_views=args.n_views, delay=args.delay
+        )
+    else:
+        insert_user_image_views(
+            db,
+            n_images=args.n_images,
+            n_views=args.n_views,
+            delay=args.delay,
+            seed=args.seed,
+            chunk_size=args.chunk_size,
+            resume=args.resume,
+        )
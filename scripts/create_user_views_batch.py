@@ -117,40 +117,18 @@ def parse_args():
     -------
     >>> python create_user_views_batch.py --n_batches 10 --delay 3
     """
-    import argparse
+    from htd import build_parser
 
-    parser = argparse.ArgumentParser(
-        description="Create user image views for classification tasks."
-    )
-    parser.add_argument(
-        "--delay", type=int, default=5, help="Delay for transit images."
-    )
-    parser.add_argument(
-        "--n_images", type=int, default=count_files(), help="Number of images."
-    )
-    parser.add_argument("--n_batches", type=int, default=5, help="Number of batches.")
-    parser.add_argument(
-        "--batches_per_users",
-        type=int,
-        default=2,
-        help="Number of batches per user.",
-    )
-
-    parser.add_argument(
-        "--mode",
-        type=str,
-        default="development",
-        help="Config mode (development/production).",
-    )
-
-    return parser.parse_args()
+    return build_parser("batch-views").parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
+    if args.n_images is None:
+        args.n_images = count_files()
     logging.info(
-        f"Creating user image views with {args.n_images} images, {args.n_views} views per image, "
-        f"and a delay of {args.delay}."
+        f"Creating user image views with {args.n_images} images in {args.n_batches} "
+        f"batches, {args.batches_per_users} batches per user and a delay of {args.delay}."
     )
     db = MySQLDatabase.from_config(mode=args.mode)
     insert_user_image_views(
@@ -1,13 +1,22 @@
 from mysql_database import MySQLDatabase
 
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python fetch_posts.py --output posts.csv --mode production
+    """
+    from htd import build_parser
+
+    return build_parser("export").parse_args()
+
+
 if __name__ == "__main__":
-    db = MySQLDatabase(
-        database="htd",
-        username="root",
-        # password="myPassword",
-        host="localhost",
-    )
-    df = db.query_to_dataframe("SELECT * FROM posts")
+    args = parse_args()
+    db = MySQLDatabase.from_config(mode=args.mode)
+    # Include the posts archived by maintenance.py
+    df = db.query_to_dataframe(f"SELECT * FROM {db.all_posts()} ORDER BY id")
 
     if df is not None:
-        df.to_csv("posts.csv", index=False)
+        df.to_csv(args.output, index=False)
@@ -0,0 +1,335 @@
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+# Depths of the reference transits in the models files, in units of the noise
+MODEL_DEPTHS = [1, 3, 5]
+
+
+class LightCurveGenerator:
+    """
+    LightCurveGenerator synthesizes light curves in the layout served by the
+    server: data/file_<id>.csv.zlib with the columns time, flux and flux_err, and
+    data/models_<id>.csv.zlib with reference transit profiles.
+
+    For each of the n_images files, file n_images + i is the transit twin of file
+    i, as in create_user_views.py: the same light curve (same gaps, variability and
+    noise) with an injected periodic transit, either a box or a small planet with
+    quadratic limb darkening. All light curves of a block of files are computed at
+    once as (files x points) arrays.
+
+    Blocks are generated in a process pool and seeded with (seed, block index),
+    so the output does not depend on the number of workers. As the default
+    output_dir holds the light curves served to the users, existing files are only
+    overwritten when generate is called with overwrite set.
+
+    Attributes
+    ----------
+    n_images : int
+        Number of files without transits; twice as many files are written.
+    output_dir : Path
+        Directory the files are written to.
+    baseline : float
+        Length of the light curves in days.
+    cadence : float
+        Time between two points in days.
+    n_gaps : int
+        Number of data gaps per light curve, placed uniformly at random.
+    gap_length : float
+        Length of a gap in days.
+    noise : tuple
+        Range of the white noise level, sampled log-uniformly.
+    depth : tuple
+        Range of the transit depth (planet to star area ratio), log-uniform.
+    duration : tuple
+        Range of the transit duration in days, uniform.
+    period : tuple
+        Range of the orbital period in days, log-uniform.
+    limb_darkened_fraction : float
+        Fraction of transits with limb darkening, the others are boxes.
+    seed : int
+        Random seed.
+    block_size : int
+        Number of files generated per task.
+    n_model_points : int
+        Number of points of the reference profiles.
+
+    Examples
+    --------
+    >>> generator = LightCurveGenerator(n_images=100000, cadence=0.02)
+    >>> ground_truth = generator.generate(n_workers=8)
+    """
+
+    def __init__(
+        self,
+        n_images: int,
+        output_dir: Path = DATA_DIR,
+        baseline: float = 27.0,
+        cadence: float = 30 / 1440,
+        n_gaps: int = 1,
+        gap_length: float = 1.0,
+        noise: Tuple[float, float] = (5e-4, 5e-3),
+        depth: Tuple[float, float] = (1e-3, 2e-2),
+        duration: Tuple[float, float] = (0.05, 0.3),
+        period: Tuple[float, float] = (1.0, 15.0),
+        limb_darkened_fraction: float = 0.5,
+        seed: int = 42,
+        block_size: int = 500,
+        n_model_points: int = 50,
+    ):
+        self.n_images = n_images
+        self.output_dir = Path(output_dir)
+        self.baseline = baseline
+        self.cadence = cadence
+        self.n_gaps = n_gaps
+        self.gap_length = gap_length
+        self.noise = noise
+        self.depth = depth
+        self.duration = duration
+        self.period = period
+        self.limb_darkened_fraction = limb_darkened_fraction
+        self.seed = seed
+        self.block_size = block_size
+        self.n_model_points = n_model_points
+
+    @staticmethod
+    def _log_uniform(
+        rng: np.random.RandomState, bounds: Tuple[float, float], size: int
+    ) -> np.ndarray:
+        return np.exp(rng.uniform(np.log(bounds[0]), np.log(bounds[1]), size))
+
+    def sample_parameters(
+        self, rng: np.random.RandomState, file_ids: np.ndarray
+    ) -> pd.DataFrame:
+        """Light curve and transit parameters of the given files without transit."""
+        n = len(file_ids)
+        period = self._log_uniform(rng, self.period, n)
+        return pd.DataFrame(
+            {
+                "file_id": file_ids + self.n_images,
+                "twin_file_id": file_ids,
+                "model": np.where(
+                    rng.rand(n) < self.limb_darkened_fraction, "limb_darkened", "box"
+                ),
+                "period": period,
+                "t0": rng.uniform(0, np.minimum(period, self.baseline)),
+                "duration": rng.uniform(*self.duration, n),
+                "depth": self._log_uniform(rng, self.depth, n),
+                "impact": rng.uniform(0, 0.9, n),
+                "u1": rng.uniform(0.2, 0.6, n),
+                "u2": rng.uniform(0.0, 0.3, n),
+                "noise": self._log_uniform(rng, self.noise, n),
+                "variability": rng.uniform(0, 2, n),
+                "variability_period": rng.uniform(2, 20, n),
+                "variability_phase": rng.uniform(0, 2 * np.pi, n),
+            }
+        )
+
+    @staticmethod
+    def transit_deficit(
+        times: np.ndarray, parameters: pd.DataFrame
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Flux blocked by the transiting planet, for times of shape (files, points).
+
+        Boxes block depth during the whole transit. Limb darkened transits use the
+        small planet approximation, the blocked flux is depth times the quadratic
+        limb darkening profile at the planet's position, normalized by the mean
+        intensity of the disk. Returns the deficit and the transit epochs.
+        """
+
+        def column(name):
+            return parameters[name].to_numpy()[:, None]
+
+        period, t0, duration = column("period"), column("t0"), column("duration")
+        epochs = np.round((times - t0) / period)
+        # Offset from the nearest mid-transit, in units of half the duration
+        x = (times - t0 - epochs * period) / (duration / 2)
+        in_transit = np.abs(x) < 1
+
+        impact = column("impact")
+        z2 = impact**2 + x**2 * (1 - impact**2)
+        mu = np.sqrt(np.clip(1 - z2, 0, 1))
+        u1, u2 = column("u1"), column("u2")
+        intensity = (1 - u1 * (1 - mu) - u2 * (1 - mu) ** 2) / (1 - u1 / 3 - u2 / 6)
+
+        limb_darkened = (parameters["model"] == "limb_darkened").to_numpy()[:, None]
+        profile = np.where(limb_darkened, intensity, 1.0)
+        return np.where(in_transit, column("depth") * profile, 0.0), epochs
+
+    def reference_profiles(self, noise: float) -> dict:
+        """Limb darkened transit profiles with depths of MODEL_DEPTHS times the noise."""
+        x = np.linspace(-1.5, 1.5, self.n_model_points)
+        mu = np.sqrt(np.clip(1 - x**2, 0, 1))
+        intensity = (1 - 0.4 * (1 - mu) - 0.2 * (1 - mu) ** 2) / (1 - 0.4 / 3 - 0.2 / 6)
+        profile = np.where(np.abs(x) < 1, intensity, 0.0)
+        return {
+            f"depth_{depth}sigma": 1 - depth * noise * profile for depth in MODEL_DEPTHS
+        }
+
+    def generate_block(self, block: int) -> pd.DataFrame:
+        """Generates and writes the files of one block and returns its ground truth."""
+        rng = np.random.RandomState([self.seed, block])
+        start = block * self.block_size + 1
+        file_ids = np.arange(start, min(start + self.block_size, self.n_images + 1))
+        parameters = self.sample_parameters(rng, file_ids)
+        n_files = len(file_ids)
+
+        times = np.arange(0, self.baseline, self.cadence)
+        # Jitter the cadence slightly, as real time stamps are never exact
+        times = times[None, :] + rng.normal(
+            0, self.cadence / 100, (n_files, len(times))
+        )
+
+        gap_starts = rng.uniform(
+            -self.gap_length, self.baseline, (n_files, self.n_gaps, 1)
+        )
+        observed = ~np.any(
+            (times[:, None, :] >= gap_starts)
+            & (times[:, None, :] < gap_starts + self.gap_length),
+            axis=1,
+        )
+
+        noise = parameters["noise"].to_numpy()[:, None]
+        variability = (
+            parameters["variability"].to_numpy()[:, None]
+            * noise
+            * np.sin(
+                2 * np.pi * times / parameters["variability_period"].to_numpy()[:, None]
+                + parameters["variability_phase"].to_numpy()[:, None]
+            )
+        )
+        flux = 1 + variability + rng.normal(0, 1, times.shape) * noise
+        deficit, epochs = self.transit_deficit(times, parameters)
+
+        n_transits = np.zeros(n_files, dtype=np.int64)
+        for row in range(n_files):
+            visible = observed[row] & (deficit[row] > 0)
+            n_transits[row] = len(np.unique(epochs[row, visible]))
+            mask = observed[row]
+            flux_err = np.full(mask.sum(), noise[row, 0])
+            models = self._compressed_csv(self.reference_profiles(noise[row, 0]))
+            for file_id, file_flux in [
+                (file_ids[row], flux[row]),
+                (file_ids[row] + self.n_images, flux[row] - deficit[row]),
+            ]:
+                data = self._compressed_csv(
+                    {
+                        "time": times[row, mask],
+                        "flux": file_flux[mask],
+                        "flux_err": flux_err,
+                    }
+                )
+                (self.output_dir / f"file_{file_id}.csv.zlib").write_bytes(data)
+                (self.output_dir / f"models_{file_id}.csv.zlib").write_bytes(models)
+
+        parameters["n_points"] = observed.sum(axis=1)
+        parameters["n_visible_transits"] = n_transits
+        return parameters
+
+    @staticmethod
+    def _compressed_csv(columns: dict) -> bytes:
+        """
+        Formats the columns as a zlib compressed CSV file. Formatting all values with
+        a single % operation is several times faster than DataFrame.to_csv.
+        """
+        values = np.column_stack(list(columns.values()))
+        row_format = ",".join(["%.6f"] * values.shape[1]) + "\n"
+        csv = (
+            ",".join(columns)
+            + "\n"
+            + (row_format * len(values)) % tuple(values.ravel().tolist())
+        )
+        return zlib.compress(csv.encode())
+
+    def existing_files(self) -> list:
+        """Files in output_dir that generate would overwrite."""
+        if not self.output_dir.exists():
+            return []
+        names = {
+            f"{prefix}_{file_id}.csv.zlib"
+            for prefix in ["file", "models"]
+            for file_id in range(1, 2 * self.n_images + 1)
+        }
+        return sorted(
+            path for path in self.output_dir.glob("*.csv.zlib") if path.name in names
+        )
+
+    def generate(
+        self, n_workers: Optional[int] = None, overwrite: bool = False
+    ) -> pd.DataFrame:
+        """
+        Generates all files and returns the ground truth of the transit twins.
+        Raises FileExistsError if any of the files exists, unless overwrite is set.
+        """
+        existing = [] if overwrite else self.existing_files()
+        if existing:
+            raise FileExistsError(
+                f"{len(existing)} light curves already exist in {self.output_dir}, "
+                f"e.g. {existing[0].name}. Pass --force (overwrite=True) to overwrite them."
+            )
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        n_blocks = -(-self.n_images // self.block_size)
+        n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+
+        start_time = time.perf_counter()
+        blocks = []
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            for block in pool.map(self.generate_block, range(n_blocks)):
+                blocks.append(block)
+                n_done = min(len(blocks) * self.block_size, self.n_images)
+                elapsed = time.perf_counter() - start_time
+                logging.info(
+                    f"Generated {2 * n_done}/{2 * self.n_images} light curves "
+                    f"({2 * n_done / elapsed:.0f} files/s with {n_workers} workers)."
+                )
+
+        return pd.concat(blocks, ignore_index=True)
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python generate_light_curves.py --n_images 100000 --n_workers 8
+    """
+    from htd import build_parser
+
+    return build_parser("light-curves").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    generator = LightCurveGenerator(
+        n_images=args.n_images,
+        output_dir=args.output_dir,
+        baseline=args.baseline,
+        cadence=args.cadence,
+        n_gaps=args.n_gaps,
+        gap_length=args.gap_length,
+        noise=tuple(args.noise),
+        depth=tuple(args.depth),
+        duration=tuple(args.duration),
+        period=tuple(args.period),
+        limb_darkened_fraction=args.limb_darkened_fraction,
+        seed=args.seed,
+        block_size=args.block_size,
+    )
+    ground_truth = generator.generate(n_workers=args.n_workers, overwrite=args.force)
+    Path(args.ground_truth).parent.mkdir(parents=True, exist_ok=True)
+    ground_truth.to_csv(args.ground_truth, index=False)
+    logging.info(f"Saved the ground truth to {args.ground_truth}.")
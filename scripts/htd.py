@@ -0,0 +1,737 @@
+import argparse
+import runpy
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+# Only the standard library is imported at startup, so that help and argument
+# errors are instant. The script of a command, and with it pandas, SQLAlchemy and
+# the other heavy dependencies, is only imported once its arguments are valid.
+# The scripts build their own parsers from the functions below as well.
+
+
+def add_users_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--num_users", type=int, default=10, help="Number of users to generate."
+    )
+    parser.add_argument(
+        "--password_length",
+        type=int,
+        default=5,
+        help="Length of the generated passwords.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=Path(__file__).parent / "output",
+        help="Directory to save handouts.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=None,
+        help="Number of users committed per chunk (all at once if omitted).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Checkpoint progress and resume an interrupted run.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=None,
+        help="Number of workers hashing passwords (defaults to the CPU count).",
+    )
+    parser.add_argument(
+        "--executor",
+        type=str,
+        choices=["process", "thread"],
+        default="process",
+        help="Hash passwords in a process or thread pool.",
+    )
+    parser.add_argument(
+        "--benchmark_workers",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Only benchmark the hashing throughput for these worker counts.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_views_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--n_views", type=int, default=5, help="Number of views per image."
+    )
+    parser.add_argument(
+        "--delay", type=int, default=5, help="Delay for transit images."
+    )
+    parser.add_argument(
+        "--n_images",
+        type=int,
+        default=None,
+        help="Number of images (defaults to the number of files in data/).",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=None,
+        help="Number of rows committed per chunk (all at once if omitted).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Checkpoint progress and resume an interrupted run.",
+    )
+    parser.add_argument(
+        "--extend",
+        action="store_true",
+        help="Only add views for users without UserViews entries.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_batch_views_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--delay", type=int, default=5, help="Delay for transit images."
+    )
+    parser.add_argument(
+        "--n_images",
+        type=int,
+        default=None,
+        help="Number of images (defaults to the number of files in data/).",
+    )
+    parser.add_argument("--n_batches", type=int, default=5, help="Number of batches.")
+    parser.add_argument(
+        "--batches_per_users",
+        type=int,
+        default=2,
+        help="Number of batches per user.",
+    )
+
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_validate_views_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--n_images", type=int, required=True, help="Number of images.")
+    parser.add_argument(
+        "--n_views", type=int, default=None, help="Expected number of views per image."
+    )
+    parser.add_argument(
+        "--delay",
+        type=int,
+        default=None,
+        help="Delay for transit images. Omit if no transit pairs were created.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_light_curves_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--n_images",
+        type=int,
+        required=True,
+        help="Number of light curves without transit, each gets a transit twin.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=Path(__file__).parent.parent / "data",
+        help="Directory to write the files to.",
+    )
+    parser.add_argument(
+        "--ground_truth",
+        type=str,
+        default=Path(__file__).parent / "output" / "ground_truth.csv",
+        help="Path of the ground truth table of the injected transits.",
+    )
+    parser.add_argument("--baseline", type=float, default=27.0, help="Length in days.")
+    parser.add_argument(
+        "--cadence",
+        type=float,
+        default=30 / 1440,
+        help="Time between two points in days.",
+    )
+    parser.add_argument(
+        "--n_gaps", type=int, default=1, help="Number of data gaps per light curve."
+    )
+    parser.add_argument(
+        "--gap_length", type=float, default=1.0, help="Length of a gap in days."
+    )
+    for name, default, help in [
+        ("noise", [5e-4, 5e-3], "Range of the white noise level."),
+        ("depth", [1e-3, 2e-2], "Range of the transit depth."),
+        ("duration", [0.05, 0.3], "Range of the transit duration in days."),
+        ("period", [1.0, 15.0], "Range of the orbital period in days."),
+    ]:
+        parser.add_argument(
+            f"--{name}",
+            type=float,
+            nargs=2,
+            default=default,
+            metavar=("MIN", "MAX"),
+            help=help,
+        )
+    parser.add_argument(
+        "--limb_darkened_fraction",
+        type=float,
+        default=0.5,
+        help="Fraction of limb darkened transits, the others are boxes.",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument(
+        "--block_size", type=int, default=500, help="Files generated per task."
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (defaults to the CPU count).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Overwrite existing light curves in output_dir.",
+    )
+
+
+def add_export_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--output", type=str, default="posts.csv", help="Path of the CSV file."
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_load_test_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--user_table_path",
+        type=str,
+        default=Path(__file__).parent / "output/users.csv",
+        help="Path to the users table.",
+    )
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        default="http://localhost:8000/",
+        help="Base URL of the API.",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="Speed of classification in seconds.",
+    )
+    parser.add_argument(
+        "--randomize_speed",
+        action="store_true",
+        help="Randomize the classification speed.",
+    )
+    parser.add_argument(
+        "--n_classifications",
+        type=int,
+        default=5,
+        help="Number of classifications to perform.",
+    )
+    parser.add_argument(
+        "--timings",
+        type=str,
+        default=None,
+        help="Record the phase timings of every request to this JSONL file.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Sample the client's stacks and write them to this folded file.",
+    )
+
+
+def add_correlate_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--client",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Client request timings written by load-test --timings.",
+    )
+    parser.add_argument(
+        "--server_log",
+        type=str,
+        required=True,
+        help="Server output with the request_timing lines.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=Path(__file__).parent / "output/correlated_timings.csv",
+        help="Path of the joined client and server timings.",
+    )
+
+
+def add_replay_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--user_table_path",
+        type=str,
+        default=Path(__file__).parent / "output/users.csv",
+        help="Path to the users table of the test accounts.",
+    )
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        default="http://localhost:8000/",
+        help="Base URL of the API.",
+    )
+    parser.add_argument(
+        "--posts_path",
+        type=str,
+        default=None,
+        help="Read recorded posts from a CSV file instead of the database.",
+    )
+    parser.add_argument(
+        "--since", type=str, default=None, help="Only replay posts from this time on."
+    )
+    parser.add_argument(
+        "--until", type=str, default=None, help="Only replay posts before this time."
+    )
+    parser.add_argument(
+        "--time_factor",
+        type=float,
+        default=1.0,
+        help="Speed up the replay by this factor (1 replays in real time).",
+    )
+    parser.add_argument(
+        "--max_gap",
+        type=float,
+        default=600.0,
+        help="Cap recorded gaps between classifications at this many seconds.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode of the database with the recorded posts.",
+    )
+
+
+def add_soak_test_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--user_table_path",
+        type=str,
+        default=Path(__file__).parent / "output/users.csv",
+        help="Path to the users table.",
+    )
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        default="http://localhost:8000/",
+        help="Base URL of the API.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=4 * 3600,
+        help="Duration of the soak test in seconds.",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=300,
+        help="Length of a sampling window in seconds.",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=2.0,
+        help="Mean seconds between classifications per user.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=Path(__file__).parent / "output",
+        help="Directory to save the time series report.",
+    )
+    parser.add_argument(
+        "--no_db",
+        action="store_true",
+        help="Do not poll database metrics.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_monitor_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--target_views",
+        type=int,
+        default=5,
+        help="Number of classifications each file should receive.",
+    )
+    parser.add_argument(
+        "--n_files",
+        type=int,
+        default=None,
+        help="Number of files (defaults to the largest file_id in UserViews).",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=5.0, help="Seconds between polls."
+    )
+    parser.add_argument(
+        "--active_minutes",
+        type=float,
+        default=5.0,
+        help="Users who posted within this many minutes count as active.",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Print the summary once and exit."
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_consensus_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=None,
+        help="Read posts from a CSV file (e.g. from fetch_posts.py) instead of the database.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=Path(__file__).parent / "output" / "consensus.csv",
+        help="Path of the CSV file with the transit candidates.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Maximum gap between marked times of the same cluster.",
+    )
+    parser.add_argument(
+        "--min_support",
+        type=int,
+        default=1,
+        help="Minimum number of distinct users supporting a candidate.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=None,
+        help="Number of processes clustering file id shards.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_incremental_consensus_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--n_images", type=int, required=True, help="Number of images.")
+    parser.add_argument(
+        "--bin_width",
+        type=float,
+        default=0.01,
+        help="Resolution of the marked time sketch.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Maximum gap between marked times of the same cluster.",
+    )
+    parser.add_argument(
+        "--min_marks",
+        type=int,
+        default=1,
+        help="Minimum number of marks of a candidate.",
+    )
+    parser.add_argument(
+        "--recompute",
+        action="store_true",
+        help="Discard the stored state and recompute from all posts.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=Path(__file__).parent / "output",
+        help="Directory to save the candidates and reliability tables.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_migrate_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_maintenance_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--jobs",
+        nargs="+",
+        choices=["sessions", "posts"],
+        default=["sessions", "posts"],
+        help="Maintenance jobs to run.",
+    )
+    parser.add_argument(
+        "--archive_days",
+        type=float,
+        default=30.0,
+        help="Archive posts older than this many days.",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=1000, help="Maximum rows per batch."
+    )
+    parser.add_argument(
+        "--pause", type=float, default=0.1, help="Seconds to sleep between batches."
+    )
+    parser.add_argument(
+        "--lock_wait_timeout",
+        type=int,
+        default=2,
+        help="Lock wait timeout of the maintenance sessions in seconds.",
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only count the rows that would be processed.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="development",
+        help="Config mode (development/production).",
+    )
+
+
+def add_benchmark_arguments(parser: argparse.ArgumentParser):
+    from benchmark import BENCHMARK_DIR, BENCHMARKS, SCALES
+
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run.",
+    )
+    parser.add_argument(
+        "--scale",
+        choices=list(SCALES),
+        default="small",
+        help="Preset for the number of users, images, views and batches.",
+    )
+    for parameter in ["users", "images", "views", "batches"]:
+        parser.add_argument(
+            f"--{parameter}",
+            type=int,
+            default=None,
+            help=f"Override the number of {parameter} of the scale preset.",
+        )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs per benchmark."
+    )
+    parser.add_argument(
+        "--no_tracemalloc",
+        action="store_true",
+        help="Skip the run measuring Python allocations.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Path of the JSON results (defaults to a timestamped file).",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=BENCHMARK_DIR / "baseline.json",
+        help="Baseline to compare against.",
+    )
+    parser.add_argument(
+        "--save_baseline",
+        action="store_true",
+        help="Save the results as the new baseline.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative increase over the baseline reported as a regression.",
+    )
+
+
+# Command name: (script module, description, function adding the arguments)
+COMMANDS = {
+    "users": (
+        "user_generation",
+        "Generate users and user handouts.",
+        add_users_arguments,
+    ),
+    "views": (
+        "create_user_views",
+        "Create user image views for classification tasks.",
+        add_views_arguments,
+    ),
+    "batch-views": (
+        "create_user_views_batch",
+        "Create batched user image views for classification tasks.",
+        add_batch_views_arguments,
+    ),
+    "validate-views": (
+        "validate_user_views",
+        "Validate the user image views stored in the UserViews table.",
+        add_validate_views_arguments,
+    ),
+    "light-curves": (
+        "generate_light_curves",
+        "Generate synthetic light curves with transit twins.",
+        add_light_curves_arguments,
+    ),
+    "export": (
+        "fetch_posts",
+        "Export the posts, archived ones included, to a CSV file.",
+        add_export_arguments,
+    ),
+    "load-test": (
+        "async_api_client",
+        "Classify images using the HTD API.",
+        add_load_test_arguments,
+    ),
+    "correlate": (
+        "correlate_timings",
+        "Join load-test request timings with the server's timing logs.",
+        add_correlate_arguments,
+    ),
+    "replay": (
+        "traffic_replay",
+        "Replay recorded classification sessions against the HTD API.",
+        add_replay_arguments,
+    ),
+    "soak-test": (
+        "soak_test",
+        "Run a steady long-running load and detect latency drift.",
+        add_soak_test_arguments,
+    ),
+    "monitor": (
+        "monitor",
+        "Monitor the classification progress of a running event.",
+        add_monitor_arguments,
+    ),
+    "consensus": (
+        "consensus",
+        "Compute consensus transit candidates from the posts table.",
+        add_consensus_arguments,
+    ),
+    "incremental-consensus": (
+        "incremental_consensus",
+        "Update consensus and classifier reliability from new posts.",
+        add_incremental_consensus_arguments,
+    ),
+    "maintenance": (
+        "maintenance",
+        "Purge expired sessions and archive old posts in small batches.",
+        add_maintenance_arguments,
+    ),
+    "migrate": (
+        "migrate",
+        "Bring an existing database up to date with the current schema.",
+        add_migrate_arguments,
+    ),
+    "benchmark": (
+        "benchmark",
+        "Benchmark the data generation and database scripts.",
+        add_benchmark_arguments,
+    ),
+}
+
+
+def build_parser(
+    command: Optional[str] = None, selected: Optional[str] = None
+) -> argparse.ArgumentParser:
+    """
+    Builds the parser of a single command, as used when running its script
+    directly, or of htd with all commands as subcommands. With selected given,
+    only the arguments of the selected subcommand are added, as the others are
+    not needed to parse the command line.
+    """
+    if command is not None:
+        _, description, add_arguments = COMMANDS[command]
+        parser = argparse.ArgumentParser(description=description)
+        add_arguments(parser)
+        return parser
+
+    parser = argparse.ArgumentParser(
+        prog="htd",
+        description="Setup, load testing and analysis tools of the HTD platform.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, (_, description, add_arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(
+            name, help=description, description=description
+        )
+        if selected is None or name == selected:
+            add_arguments(subparser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """Validates the arguments and runs the script of the command."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = build_parser(selected=argv[0] if argv else None).parse_args(argv)
+    module = COMMANDS[args.command][0]
+
+    # The command is the first argument, the script parses the rest again
+    scripts_dir = Path(__file__).parent
+    sys.argv = [str(scripts_dir / f"{module}.py"), *argv[1:]]
+    if str(scripts_dir) not in sys.path:
+        sys.path.insert(0, str(scripts_dir))
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
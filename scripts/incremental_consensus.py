@@ -0,0 +1,363 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from array_utils import segment_starts
+from consensus import count_classifiers
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+STATE_PATH = Path(__file__).parent / "output" / "consensus_state.npz"
+
+BIN_DTYPES = {
+    "file_id": np.int64,
+    "bin": np.int64,
+    "n_marks": np.int64,
+    "weight": np.float64,
+    "weighted_time": np.float64,
+    "weighted_time_sq": np.float64,
+}
+PAIR_DTYPES = {
+    "user_id": np.int64,
+    "base_file_id": np.int64,
+    "seen": bool,
+    "seen_twin": bool,
+    "marked": bool,
+    "marked_twin": bool,
+}
+USER_DTYPES = {
+    "user_id": np.int64,
+    "n_posts": np.int64,
+    "n_marks": np.int64,
+    "certainty_sum": np.float64,
+}
+
+
+def _empty_frame(dtypes: dict) -> pd.DataFrame:
+    """Creates an empty DataFrame with typed columns."""
+    return pd.DataFrame(
+        {column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()}
+    )
+
+
+class IncrementalConsensus:
+    """
+    IncrementalConsensus maintains compact running statistics of the posts table and
+    updates them from the posts added since the last update only.
+
+    The state consists of additive per-file sums over time bins of width bin_width
+    (the sketch of the marked times), per-user counters and one row of flags per user
+    and image pair (file i and its transit twin n_images + i). Updating from new
+    posts merges sums, counts and flags, so any sequence of updates yields the same
+    state as a single update over all posts.
+
+    Auto-increment ids are assigned before commit, so a post can become visible
+    after posts with higher ids. Every update therefore re-reads the overlap ids
+    below the watermark and skips the posts already merged, which are tracked by id
+    within that range.
+
+    Candidates count marks rather than distinct users, their support column is
+    named n_marks to set it apart from the support of consensus.py.
+
+    Attributes
+    ----------
+    n_images : int
+        Number of images without transits, file n_images + i is the twin of file i.
+    bin_width : float
+        Resolution of the marked time sketch.
+    watermark : int
+        Highest posts.id included in the state.
+    overlap : int
+        Number of ids below the watermark that are re-read on every update.
+    recent_ids : np.ndarray
+        Ids of the merged posts within overlap of the watermark.
+
+    Examples
+    --------
+    >>> consensus = IncrementalConsensus.load(n_images=100)
+    >>> consensus.update_from_database(db)
+    >>> consensus.candidates(tolerance=0.1, min_marks=3)
+    >>> consensus.reliability()
+    >>> consensus.save()
+    """
+
+    def __init__(self, n_images: int, bin_width: float = 0.01, overlap: int = 1000):
+        self.n_images = n_images
+        self.bin_width = bin_width
+        self.overlap = overlap
+        self.watermark = 0
+        self.recent_ids = np.array([], dtype=np.int64)
+        self.bins = _empty_frame(BIN_DTYPES)
+        self.pairs = _empty_frame(PAIR_DTYPES)
+        self.users = _empty_frame(USER_DTYPES)
+
+    def update(self, posts: pd.DataFrame):
+        """
+        Merges posts (with the columns id, file_id, user_id, time and certainty) into
+        the state. Posts that were already merged, or are more than overlap ids below
+        the watermark, are ignored.
+        """
+        ids = posts["id"].to_numpy(dtype=np.int64)
+        posts = posts[
+            (ids > self.watermark - self.overlap) & ~np.isin(ids, self.recent_ids)
+        ].drop_duplicates("id")
+        if posts.empty:
+            return
+
+        file_ids = posts["file_id"].to_numpy(dtype=np.int64)
+        user_ids = posts["user_id"].to_numpy(dtype=np.int64)
+        times = posts["time"].to_numpy(dtype=np.float64, na_value=np.nan)
+        certainties = np.nan_to_num(
+            posts["certainty"].to_numpy(dtype=np.float64, na_value=np.nan), nan=1.0
+        )
+        marked = ~np.isnan(times)
+
+        # Sketch of the marked times: certainty weighted sums per time bin
+        bin_ids = np.floor(times[marked] / self.bin_width).astype(np.int64)
+        new_bins = pd.DataFrame(
+            {
+                "file_id": file_ids[marked],
+                "bin": bin_ids,
+                "n_marks": 1,
+                "weight": certainties[marked],
+                "weighted_time": certainties[marked] * times[marked],
+                "weighted_time_sq": certainties[marked] * times[marked] ** 2,
+            }
+        )
+        self.bins = self._merge(self.bins, new_bins, ["file_id", "bin"], "sum")
+
+        # Which user saw and marked which file of each image pair
+        is_twin = file_ids > self.n_images
+        new_pairs = pd.DataFrame(
+            {
+                "user_id": user_ids,
+                "base_file_id": np.where(is_twin, file_ids - self.n_images, file_ids),
+                "seen": ~is_twin,
+                "seen_twin": is_twin,
+                "marked": ~is_twin & marked,
+                "marked_twin": is_twin & marked,
+            }
+        )
+        self.pairs = self._merge(
+            self.pairs, new_pairs, ["user_id", "base_file_id"], "max"
+        )
+
+        new_users = pd.DataFrame(
+            {
+                "user_id": user_ids,
+                "n_posts": 1,
+                "n_marks": marked.astype(np.int64),
+                "certainty_sum": certainties,
+            }
+        )
+        self.users = self._merge(self.users, new_users, ["user_id"], "sum")
+
+        self.watermark = max(self.watermark, int(posts["id"].max()))
+        recent_ids = np.union1d(self.recent_ids, posts["id"].to_numpy(dtype=np.int64))
+        self.recent_ids = recent_ids[recent_ids > self.watermark - self.overlap]
+        logging.info(
+            f"Updated consensus state with {len(posts)} posts up to id {self.watermark}."
+        )
+
+    def update_from_database(self, db: MySQLDatabase):
+        """Fetches and merges the posts above the watermark minus the overlap."""
+        posts = db.query_to_dataframe(
+            "SELECT id AS post_id, file_id, user_id, time, certainty "
+            f"FROM {db.all_posts()} WHERE id > {self.watermark - self.overlap} ORDER BY id"
+        )
+        if posts is None:
+            raise ValueError("Error loading new posts.")
+        self.update(posts.rename(columns={"post_id": "id"}))
+
+    def n_classifiers(self) -> pd.Series:
+        """Number of distinct users that submitted a post for each file."""
+        seen = self.pairs[self.pairs["seen"]]
+        seen_twin = self.pairs[self.pairs["seen_twin"]]
+        file_ids = np.concatenate(
+            [seen["base_file_id"], seen_twin["base_file_id"] + self.n_images]
+        ).astype(np.int64)
+        user_ids = np.concatenate([seen["user_id"], seen_twin["user_id"]])
+        return count_classifiers(file_ids, user_ids.astype(np.int64))
+
+    def candidates(self, tolerance: float = 0.1, min_marks: int = 1) -> pd.DataFrame:
+        """
+        Consensus transit candidates computed from the time sketch. Bins of a file
+        belong to the same cluster unless separated by more than tolerance. n_marks
+        is the number of marks in the cluster, which can exceed the number of users.
+        """
+        bins = self.bins.sort_values(["file_id", "bin"])
+        if bins.empty:
+            return pd.DataFrame(columns=["file_id", "time", "time_std", "n_marks"])
+
+        file_ids = bins["file_id"].to_numpy(dtype=np.int64)
+        bin_ids = bins["bin"].to_numpy(dtype=np.int64)
+        new_cluster = segment_starts(file_ids)
+        new_cluster[1:] |= (np.diff(bin_ids) - 1) * self.bin_width > tolerance
+        starts = np.flatnonzero(new_cluster)
+
+        def reduce(column):
+            return np.add.reduceat(bins[column].to_numpy(dtype=np.float64), starts)
+
+        weight = reduce("weight")
+        consensus_time = reduce("weighted_time") / weight
+        variance = reduce("weighted_time_sq") / weight - consensus_time**2
+        n_classifiers = self.n_classifiers()
+
+        candidates = pd.DataFrame(
+            {
+                "file_id": file_ids[starts],
+                "time": consensus_time,
+                "time_std": np.sqrt(np.clip(variance, 0, None)),
+                "n_marks": reduce("n_marks").astype(np.int64),
+                "n_classifiers": n_classifiers.reindex(file_ids[starts])
+                .fillna(0)
+                .to_numpy(dtype=np.int64),
+                "weight": weight,
+            }
+        )
+        candidates["marks_per_classifier"] = candidates["n_marks"] / candidates[
+            "n_classifiers"
+        ].replace(0, np.nan)
+        return candidates[candidates["n_marks"] >= min_marks].reset_index(drop=True)
+
+    def reliability(self) -> pd.DataFrame:
+        """
+        Classifier reliability per user from the transit-injection design: the rate
+        at which a user marks the injected transit in file n_images + i, and how often
+        they mark file i, among the pairs where they classified both files.
+        """
+        pairs = self.pairs[self.pairs["seen"] & self.pairs["seen_twin"]]
+        per_user = pairs.groupby("user_id").agg(
+            n_pairs=("base_file_id", "size"),
+            n_twins_marked=("marked_twin", "sum"),
+            n_plain_marked=("marked", "sum"),
+        )
+        per_user["detection_rate"] = per_user["n_twins_marked"] / per_user["n_pairs"]
+        per_user["plain_mark_rate"] = per_user["n_plain_marked"] / per_user["n_pairs"]
+        per_user["agreement"] = (
+            (pairs["marked"] == pairs["marked_twin"]).groupby(pairs["user_id"]).mean()
+        )
+
+        users = self.users.set_index("user_id")
+        users["mean_certainty"] = users["certainty_sum"] / users["n_posts"]
+        return users[["n_posts", "n_marks", "mean_certainty"]].join(
+            per_user, how="left"
+        )
+
+    def save(self, path: Optional[Path] = None):
+        """Saves the state to a compressed NumPy archive."""
+        path = STATE_PATH if path is None else Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            f"{name}__{column}": frame[column].to_numpy(dtype=dtype)
+            for name, frame, dtypes in [
+                ("bins", self.bins, BIN_DTYPES),
+                ("pairs", self.pairs, PAIR_DTYPES),
+                ("users", self.users, USER_DTYPES),
+            ]
+            for column, dtype in dtypes.items()
+        }
+        np.savez_compressed(
+            path,
+            n_images=self.n_images,
+            bin_width=self.bin_width,
+            watermark=self.watermark,
+            overlap=self.overlap,
+            recent_ids=self.recent_ids,
+            **arrays,
+        )
+
+    @classmethod
+    def load(
+        cls, n_images: int, bin_width: float = 0.01, path: Optional[Path] = None
+    ) -> "IncrementalConsensus":
+        """Loads the state from path, or starts from an empty state if it is missing."""
+        path = STATE_PATH if path is None else Path(path)
+        consensus = cls(n_images=n_images, bin_width=bin_width)
+        if not path.exists():
+            return consensus
+
+        with np.load(path) as archive:
+            if int(archive["n_images"]) != n_images or (
+                float(archive["bin_width"]) != bin_width
+            ):
+                raise ValueError(
+                    f"State {path} was created with n_images={int(archive['n_images'])} "
+                    f"and bin_width={float(archive['bin_width'])}. "
+                    "Delete it to recompute from scratch."
+                )
+            consensus.watermark = int(archive["watermark"])
+            consensus.overlap = int(archive["overlap"])
+            consensus.recent_ids = archive["recent_ids"].astype(np.int64)
+            for name, dtypes in [
+                ("bins", BIN_DTYPES),
+                ("pairs", PAIR_DTYPES),
+                ("users", USER_DTYPES),
+            ]:
+                setattr(
+                    consensus,
+                    name,
+                    pd.DataFrame(
+                        {
+                            column: archive[f"{name}__{column}"].astype(dtype)
+                            for column, dtype in dtypes.items()
+                        }
+                    ),
+                )
+
+        logging.info(f"Loaded consensus state up to post id {consensus.watermark}.")
+        return consensus
+
+    @staticmethod
+    def _merge(
+        state: pd.DataFrame, new: pd.DataFrame, keys: list, how: str
+    ) -> pd.DataFrame:
+        """Merges new rows into the state, combining rows with equal keys."""
+        new = new.groupby(keys, as_index=False).agg(how)
+        if state.empty:
+            return new
+        return (
+            pd.concat([state, new], ignore_index=True)
+            .groupby(keys, as_index=False)
+            .agg(how)
+        )
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python incremental_consensus.py --n_images 100 --min_marks 3
+    """
+    from htd import build_parser
+
+    return build_parser("incremental-consensus").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = MySQLDatabase.from_config(mode=args.mode)
+    if args.recompute:
+        consensus = IncrementalConsensus(
+            n_images=args.n_images, bin_width=args.bin_width
+        )
+    else:
+        consensus = IncrementalConsensus.load(
+            n_images=args.n_images, bin_width=args.bin_width
+        )
+
+    consensus.update_from_database(db)
+    consensus.save()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    consensus.candidates(tolerance=args.tolerance, min_marks=args.min_marks).to_csv(
+        output_dir / "consensus_incremental.csv", index=False
+    )
+    consensus.reliability().to_csv(output_dir / "reliability.csv")
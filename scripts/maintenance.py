@@ -0,0 +1,301 @@
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import mysql.connector
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+# Lock wait timeout (ER_LOCK_WAIT_TIMEOUT) and deadlock (ER_LOCK_DEADLOCK)
+LOCK_ERRORS = {1205, 1213}
+
+
+def _is_lock_error(error: Exception) -> bool:
+    if isinstance(error, mysql.connector.Error):
+        return error.errno in LOCK_ERRORS
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+class BatchedJob(ABC):
+    """
+    BatchedJob deletes or moves rows in small batches ordered by primary key, so
+    that every transaction only locks a short key range and live traffic is never
+    blocked for long.
+
+    Each batch selects the next batch_size keys above the last processed key and
+    runs the statements returned by batch_statements on them in one transaction,
+    then sleeps for pause seconds. A batch that fails on a lock wait timeout or
+    deadlock is rolled back and retried with half the batch size. The innodb lock
+    wait timeout of the job's sessions is lowered to lock_wait_timeout seconds, so
+    the job gives way to the server instead of the other way round.
+
+    Attributes
+    ----------
+    db : MySQLDatabase
+        Database to maintain.
+    table : str
+        Table to select the keys from.
+    key : str
+        Primary key column of the table.
+    condition : str
+        Condition of the rows to process, with placeholders for parameters.
+    parameters : tuple
+        Parameters of condition.
+    batch_size : int
+        Maximum number of rows per batch.
+    pause : float
+        Seconds to sleep between batches.
+    lock_wait_timeout : int
+        Lock wait timeout of the job's sessions in seconds (MySQL only).
+    max_retries : int
+        Number of retries of a batch after lock errors before giving up.
+    """
+
+    def __init__(
+        self,
+        db: MySQLDatabase,
+        table: str,
+        key: str,
+        condition: str,
+        parameters: tuple = (),
+        batch_size: int = 1000,
+        pause: float = 0.1,
+        lock_wait_timeout: int = 2,
+        max_retries: int = 5,
+    ):
+        self.db = db
+        self.table = table
+        self.key = key
+        self.condition = condition
+        self.parameters = parameters
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lock_wait_timeout = lock_wait_timeout
+        self.max_retries = max_retries
+
+    @abstractmethod
+    def batch_statements(self, keys: list) -> List[tuple]:
+        """(statement, parameters) pairs processing the rows with the given keys."""
+
+    def count(self) -> int:
+        """Number of rows left to process."""
+        results = self.db.query(
+            f"SELECT COUNT(*) FROM {self.table} WHERE {self.condition}",
+            self.parameters,
+        )
+        return results[0][0] if results else 0
+
+    def _next_keys(self, last_key, batch_size: int) -> list:
+        condition, parameters = self.condition, self.parameters
+        if last_key is not None:
+            condition = f"{self.key} > {self.db.placeholder} AND {condition}"
+            parameters = (last_key, *parameters)
+        results = self.db.query(
+            f"SELECT {self.key} FROM {self.table} WHERE {condition} "
+            f"ORDER BY {self.key} LIMIT {batch_size}",
+            parameters,
+        )
+        if results is None:
+            raise RuntimeError(f"Error selecting the next batch of {self.table}.")
+        return [row[0] for row in results]
+
+    def _server_lock_wait(self) -> Optional[float]:
+        """Total time the server spent waiting for row locks in seconds (MySQL only)."""
+        if self.db.dialect != "mysql":
+            return None
+        results = self.db.query("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_time'")
+        return int(results[0][1]) / 1000 if results else None
+
+    def run(self, dry_run: bool = False) -> dict:
+        """Processes all rows matching the condition and returns the statistics."""
+        report = {
+            "table": self.table,
+            "rows": 0,
+            "batches": 0,
+            "retries": 0,
+            "seconds": 0.0,
+            "max_batch_seconds": 0.0,
+            "lock_wait_seconds": 0.0,
+        }
+        if dry_run:
+            report["rows"] = self.count()
+            logging.info(f"Would process {report['rows']} rows of {self.table}.")
+            return report
+
+        session_settings = (
+            [(f"SET SESSION innodb_lock_wait_timeout = {self.lock_wait_timeout}", None)]
+            if self.db.dialect == "mysql"
+            else []
+        )
+        server_lock_wait = self._server_lock_wait()
+        start = time.perf_counter()
+        last_key = None
+        batch_size = self.batch_size
+        retries = 0
+
+        while True:
+            keys = self._next_keys(last_key, batch_size)
+            if not keys:
+                break
+
+            batch_start = time.perf_counter()
+            try:
+                self.db.execute(session_settings + self.batch_statements(keys))
+            except Exception as error:
+                if not _is_lock_error(error) or retries >= self.max_retries:
+                    raise
+                # The time spent until the lock error was waiting for locks
+                report["lock_wait_seconds"] += time.perf_counter() - batch_start
+                report["retries"] += 1
+                retries += 1
+                batch_size = max(1, batch_size // 2)
+                logging.warning(
+                    f"Lock error on {self.table}, retrying with {batch_size} rows: "
+                    f"{error}"
+                )
+                time.sleep(self.pause * 2**retries)
+                continue
+
+            batch_seconds = time.perf_counter() - batch_start
+            retries = 0
+            batch_size = min(self.batch_size, batch_size * 2)
+            last_key = keys[-1]
+            report["rows"] += len(keys)
+            report["batches"] += 1
+            report["max_batch_seconds"] = max(
+                report["max_batch_seconds"], batch_seconds
+            )
+            if report["batches"] % 100 == 0:
+                elapsed = time.perf_counter() - start
+                logging.info(
+                    f"Processed {report['rows']} rows of {self.table} "
+                    f"({report['rows'] / elapsed:.0f} rows/s)."
+                )
+            time.sleep(self.pause)
+
+        report["seconds"] = time.perf_counter() - start
+        report["rows_per_second"] = (
+            report["rows"] / report["seconds"] if report["seconds"] > 0 else 0.0
+        )
+        if server_lock_wait is not None:
+            # Includes lock waits of all sessions while the job was running
+            report["server_lock_wait_seconds"] = (
+                self._server_lock_wait() - server_lock_wait
+            )
+        return report
+
+
+class ExpiredSessionPurge(BatchedJob):
+    """Deletes the sessions that expired before the given time."""
+
+    def __init__(self, db: MySQLDatabase, before: datetime, **kwargs):
+        super().__init__(
+            db,
+            table="sessions",
+            key="id",
+            condition=f"expires_at < {db.placeholder}",
+            parameters=(f"{before:%Y-%m-%d %H:%M:%S}",),
+            **kwargs,
+        )
+
+    def batch_statements(self, keys: list) -> List[tuple]:
+        placeholders = ", ".join([self.db.placeholder] * len(keys))
+        return [(f"DELETE FROM sessions WHERE id IN ({placeholders})", tuple(keys))]
+
+
+class PostArchiver(BatchedJob):
+    """
+    Moves the posts created before the given time into posts_archive. The copy and
+    the delete of a batch run in the same transaction, so every post is always in
+    exactly one of the two tables. The analysis scripts (consensus, incremental
+    consensus, monitor, replay and export) read both tables through all_posts(), so
+    archiving does not change their results.
+    """
+
+    columns = ["id", "file_id", "user_id", "time", "certainty", "createdAt"]
+
+    def __init__(self, db: MySQLDatabase, before: datetime, **kwargs):
+        super().__init__(
+            db,
+            table="posts",
+            key="id",
+            condition=f"createdAt < {db.placeholder}",
+            parameters=(f"{before:%Y-%m-%d %H:%M:%S}",),
+            **kwargs,
+        )
+
+    def run(self, dry_run: bool = False) -> dict:
+        # Databases created before posts_archive was added to the schema lack it
+        if not dry_run:
+            self.db.create_posts_archive()
+        return super().run(dry_run)
+
+    def batch_statements(self, keys: list) -> List[tuple]:
+        # Keys are consecutive in id order, so a range selects exactly the batch
+        placeholder = self.db.placeholder
+        batch = f"id BETWEEN {placeholder} AND {placeholder} AND {self.condition}"
+        parameters = (keys[0], keys[-1], *self.parameters)
+        columns = ", ".join(self.columns)
+        return [
+            (
+                f"INSERT INTO posts_archive ({columns}) "
+                f"SELECT {columns} FROM posts WHERE {batch}",
+                parameters,
+            ),
+            (f"DELETE FROM posts WHERE {batch}", parameters),
+        ]
+
+
+def log_report(report: dict):
+    message = (
+        f"{report['table']}: {report['rows']} rows in {report['batches']} batches, "
+        f"{report['seconds']:.1f}s ({report.get('rows_per_second', 0):.0f} rows/s), "
+        f"slowest batch {report['max_batch_seconds'] * 1000:.0f} ms, "
+        f"{report['retries']} retries after "
+        f"{report['lock_wait_seconds']:.1f}s of lock errors"
+    )
+    if "server_lock_wait_seconds" in report:
+        message += f", server row lock wait {report['server_lock_wait_seconds']:.1f}s"
+    logging.info(message + ".")
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python maintenance.py --archive_days 30 --batch_size 500 --pause 0.2
+    """
+    from htd import build_parser
+
+    return build_parser("maintenance").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = MySQLDatabase.from_config(mode=args.mode)
+    now = datetime.now()
+    options = dict(
+        batch_size=args.batch_size,
+        pause=args.pause,
+        lock_wait_timeout=args.lock_wait_timeout,
+    )
+
+    jobs = []
+    if "sessions" in args.jobs:
+        jobs.append(ExpiredSessionPurge(db, before=now, **options))
+    if "posts" in args.jobs:
+        jobs.append(
+            PostArchiver(db, before=now - timedelta(days=args.archive_days), **options)
+        )
+
+    for job in jobs:
+        report = job.run(dry_run=args.dry_run)
+        if not args.dry_run:
+            log_report(report)
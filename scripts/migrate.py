@@ -0,0 +1,26 @@
+import logging
+
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python migrate.py --mode production
+    """
+    from htd import build_parser
+
+    return build_parser("migrate").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = MySQLDatabase.from_config(mode=args.mode)
+    db.migrate()
+    logging.info(f"Database {db.identity} is up to date.")
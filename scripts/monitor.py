@@ -0,0 +1,259 @@
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+
+class ProgressMonitor:
+    """
+    ProgressMonitor follows the classification progress of a running event.
+
+    The full tables are read only once at startup, using aggregate queries. Every
+    tick afterwards fetches the posts above the last seen posts.id and the users
+    after the last seen (updatedAt, id), both bounded by batch_size, so that the
+    cost per tick stays low no matter how large the tables grow. Ordering users by
+    id within the same updatedAt second lets the cursor advance even when more
+    than batch_size users were updated in one second. All statistics are
+    maintained as in-memory counters.
+
+    A classification is a distinct (file, user) pair, in the startup query as in
+    every tick, so that a user posting a file again counts once and restarting the
+    monitor does not change the counts. The seen pairs are kept in memory, at most
+    one per view of the event.
+
+    Attributes
+    ----------
+    db : MySQLDatabase
+        Database to monitor.
+    target_views : int
+        Number of distinct classifications each file should receive.
+    n_files : int
+        Number of files, defaults to the largest file_id in UserViews.
+    active_window : timedelta
+        Users who posted within this window count as active.
+    batch_size : int
+        Maximum number of rows fetched per table and tick.
+
+    Examples
+    --------
+    >>> monitor = ProgressMonitor(MySQLDatabase.from_config(), target_views=5)
+    >>> monitor.run(interval=5)
+    """
+
+    def __init__(
+        self,
+        db: MySQLDatabase,
+        target_views: int = 5,
+        n_files: Optional[int] = None,
+        active_window: timedelta = timedelta(minutes=5),
+        batch_size: int = 10000,
+    ):
+        self.db = db
+        self.target_views = target_views
+        self.active_window = active_window
+        self.batch_size = batch_size
+
+        self.last_post_id = 0
+        self.last_user_update: Optional[datetime] = None
+        self.last_user_id = 0
+        self.n_posts = 0
+        self.n_classifications = 0
+        self.file_users = set()
+        self.view_indices = {}
+        self.user_updates = {}
+        self.recent_classifications = deque()
+
+        self.n_files = self._fetch_n_files() if n_files is None else n_files
+        self.views_per_file = np.zeros(self.n_files + 1, dtype=np.int64)
+        self._initialize()
+
+    def _fetch_n_files(self) -> int:
+        results = self.db.query("SELECT MAX(file_id) FROM UserViews")
+        return int(results[0][0]) if results and results[0][0] is not None else 0
+
+    def _initialize(self):
+        """
+        Loads the current totals with aggregate queries. Archived posts are included,
+        new posts are only ever added to posts.
+        """
+        results = self.db.query(f"SELECT COUNT(*), MAX(id) FROM {self.db.all_posts()}")
+        if results is None:
+            raise ValueError("Error loading the posts table.")
+        self.n_posts, last_post_id = results[0]
+        self.last_post_id = last_post_id or 0
+
+        file_users = self.db.query(
+            f"SELECT DISTINCT file_id, user_id FROM {self.db.all_posts()}"
+        )
+        if file_users is None:
+            raise ValueError("Error loading the classifications.")
+        self._add_classifications(file_users)
+
+        self._update_users(
+            self.db.query("SELECT id, view_index, updatedAt FROM users") or []
+        )
+
+    def _add_classifications(self, file_users) -> int:
+        """Counts the (file_id, user_id) pairs not seen before, returns their number."""
+        new_file_users = set(file_users) - self.file_users
+        self.file_users |= new_file_users
+        file_ids = np.array([file_id for file_id, _ in new_file_users], dtype=np.int64)
+        self._count_views(file_ids, np.ones(len(file_ids), dtype=np.int64))
+        self.n_classifications += len(new_file_users)
+        return len(new_file_users)
+
+    def _count_views(self, file_ids: np.ndarray, counts: np.ndarray):
+        if len(file_ids) and file_ids.max() > self.n_files:
+            self.n_files = int(file_ids.max())
+            self.views_per_file = np.pad(
+                self.views_per_file, (0, self.n_files + 1 - len(self.views_per_file))
+            )
+        np.add.at(self.views_per_file, file_ids, counts)
+
+    def _update_users(self, rows: list):
+        for user_id, view_index, updated_at in rows:
+            self.view_indices[user_id] = view_index
+            self.user_updates[user_id] = updated_at
+            if self.last_user_update is None or (updated_at, user_id) > (
+                self.last_user_update,
+                self.last_user_id,
+            ):
+                self.last_user_update = updated_at
+                self.last_user_id = user_id
+
+    def poll(self):
+        """Fetches the rows changed since the last poll and updates the counters."""
+        posts = self.db.query(
+            "SELECT id, file_id, user_id FROM posts "
+            f"WHERE id > {self.last_post_id} ORDER BY id LIMIT {self.batch_size}"
+        )
+        if posts:
+            ids, file_ids, user_ids = zip(*posts)
+            self.last_post_id = max(ids)
+            self.n_posts += len(posts)
+
+            n_new = self._add_classifications(zip(file_ids, user_ids))
+            self.recent_classifications.append((time.monotonic(), n_new))
+
+        since, parameters = "", None
+        if self.last_user_update is not None:
+            placeholder = self.db.placeholder
+            since = (
+                f"WHERE updatedAt > {placeholder} "
+                f"OR (updatedAt = {placeholder} AND id > {placeholder}) "
+            )
+            last_update = f"{self.last_user_update:%Y-%m-%d %H:%M:%S}"
+            parameters = (last_update, last_update, self.last_user_id)
+        users = self.db.query(
+            f"SELECT id, view_index, updatedAt FROM users {since}"
+            f"ORDER BY updatedAt, id LIMIT {self.batch_size}",
+            parameters,
+        )
+        self._update_users(users or [])
+
+    def classifications_per_minute(self) -> float:
+        """Classifications received during the last minute of polling."""
+        now = time.monotonic()
+        while self.recent_classifications and (
+            now - self.recent_classifications[0][0] > 60
+        ):
+            self.recent_classifications.popleft()
+        return float(sum(count for _, count in self.recent_classifications))
+
+    def summary(self) -> dict:
+        """Current counters of the event."""
+        n_active = 0
+        if self.last_user_update is not None:
+            cutoff = self.last_user_update - self.active_window
+            n_active = sum(
+                updated_at >= cutoff for updated_at in self.user_updates.values()
+            )
+        view_indices = np.fromiter(self.view_indices.values(), dtype=np.int64)
+        views = self.views_per_file[1:]
+
+        return {
+            "posts": self.n_posts,
+            "classifications": self.n_classifications,
+            "classifications_per_minute": self.classifications_per_minute(),
+            "users": len(view_indices),
+            "active_users": n_active,
+            "view_index_percentiles": (
+                dict(
+                    zip(
+                        ["min", "25%", "50%", "75%", "max"],
+                        np.percentile(view_indices, [0, 25, 50, 75, 100]).tolist(),
+                    )
+                )
+                if len(view_indices)
+                else {}
+            ),
+            "files": len(views),
+            "files_below_target": int(np.count_nonzero(views < self.target_views)),
+            "missing_views": int(np.clip(self.target_views - views, 0, None).sum()),
+        }
+
+    def render(self) -> str:
+        """Renders the summary as a terminal screen."""
+        summary = self.summary()
+        percentiles = ", ".join(
+            f"{key} {value:.0f}"
+            for key, value in summary["view_index_percentiles"].items()
+        )
+        lines = [
+            f"HTD classification progress - {datetime.now():%Y-%m-%d %H:%M:%S}",
+            "=" * 60,
+            f"Posts:                     {summary['posts']}",
+            f"Classifications:           {summary['classifications']}",
+            f"Classifications / minute:  {summary['classifications_per_minute']:.0f}",
+            f"Users (active):            {summary['users']} ({summary['active_users']})",
+            f"View index:                {percentiles}",
+            f"Files below {self.target_views} views:       "
+            f"{summary['files_below_target']}/{summary['files']} "
+            f"({summary['missing_views']} views missing)",
+        ]
+        return "\n".join(lines)
+
+    def run(self, interval: float = 5.0, once: bool = False):
+        """Polls and redraws the summary every interval seconds until interrupted."""
+        try:
+            while True:
+                start = time.monotonic()
+                self.poll()
+                screen = self.render()
+                print(screen if once else "\033[2J\033[H" + screen, flush=True)
+                if once:
+                    return
+                time.sleep(max(0.0, interval - (time.monotonic() - start)))
+        except KeyboardInterrupt:
+            pass
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python monitor.py --target_views 5 --interval 10 --mode production
+    """
+    from htd import build_parser
+
+    return build_parser("monitor").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    monitor = ProgressMonitor(
+        MySQLDatabase.from_config(mode=args.mode),
+        target_views=args.target_views,
+        n_files=args.n_files,
+        active_window=timedelta(minutes=args.active_minutes),
+    )
+    monitor.run(interval=args.interval, once=args.once)
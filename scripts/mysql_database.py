@@ -1,14 +1,81 @@
 import json
 import logging
+import sqlite3
+from datetime import datetime
 from pathlib import Path
-from typing import List, Literal, Optional, Tuple
+from typing import List, Literal, Optional, Sequence, Tuple
 
 import mysql.connector
 import pandas as pd
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine, create_engine, inspect
+from sqlalchemy.pool import StaticPool
 
 PROJECT_BASE = Path(__file__).parent.parent
 
+# Tables holding study data, children before the tables they reference
+DATA_TABLES = ["UserViews", "posts", "posts_archive", "sessions", "users"]
+
+# All posts including the ones moved to posts_archive by maintenance.py, see
+# MySQLDatabase.all_posts
+ALL_POSTS = (
+    "(SELECT id, file_id, user_id, time, certainty, createdAt FROM posts "
+    "UNION ALL "
+    "SELECT id, file_id, user_id, time, certainty, createdAt FROM posts_archive) "
+    "AS all_posts"
+)
+
+# Schema changes of the Python scripts, applied to existing databases by migrate
+POSTS_ARCHIVE_DDL = {
+    "mysql": (
+        "CREATE TABLE IF NOT EXISTS `posts_archive` ("
+        "`id` int(10) unsigned NOT NULL, "
+        "`file_id` int(11) NOT NULL, "
+        "`user_id` int(11) NOT NULL, "
+        "`time` float DEFAULT NULL, "
+        "`certainty` tinyint(3) unsigned DEFAULT NULL, "
+        "`createdAt` datetime NOT NULL, "
+        "PRIMARY KEY (`id`)"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci "
+        "ROW_FORMAT=COMPRESSED "
+        "COMMENT='Posts moved out of posts by scripts/maintenance.py'"
+    ),
+    "sqlite": (
+        "CREATE TABLE IF NOT EXISTS `posts_archive` ("
+        "`id` INTEGER PRIMARY KEY, "
+        "`file_id` INTEGER NOT NULL, "
+        "`user_id` INTEGER NOT NULL, "
+        "`time` REAL DEFAULT NULL, "
+        "`certainty` INTEGER DEFAULT NULL, "
+        "`createdAt` DATETIME NOT NULL)"
+    ),
+}
+USER_VIEW_ORDER_KEY_DDL = {
+    "mysql": (
+        "ALTER TABLE UserViews ADD UNIQUE KEY user_view_order (user_id, view_order)"
+    ),
+    "sqlite": (
+        "CREATE UNIQUE INDEX IF NOT EXISTS user_view_order "
+        "ON UserViews (user_id, view_order)"
+    ),
+}
+
+DATABASE_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+# Favour bulk insert throughput over durability, SQLite is a local stand-in only
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA foreign_keys=ON",
+]
+
+# Return DATETIME and TIMESTAMP columns as datetime objects, as mysql.connector does
+for _declared_type in ["DATETIME", "TIMESTAMP"]:
+    sqlite3.register_converter(
+        _declared_type, lambda value: datetime.fromisoformat(value.decode())
+    )
+
 
 class ConfigLoader:
     def __init__(
@@ -58,6 +125,15 @@ class MySQLDatabase:
         The password for the database.
     host : str
         The host address of the database.
+    dialect : str
+        Either "mysql" (default) or "sqlite". With "sqlite", the same API operates on
+        an SQLite file or in-memory database with the schema of
+        migrations/database_structure_sqlite.sql, which allows running the scripts
+        locally without a MySQL server.
+    storage : str
+        Path of the SQLite database file, or ":memory:". Only used with sqlite.
+    mode : str or None
+        Config mode the instance was created from, see from_config.
 
     Methods
     -------
@@ -77,21 +153,31 @@ class MySQLDatabase:
     ... )
     >>> df = db.query_to_dataframe("SELECT * FROM myTable")
     >>> print(df)
+
+    >>> db = MySQLDatabase(dialect="sqlite", storage=":memory:")
+    >>> db.reset()
     """
 
     def __init__(
         self,
-        database: str,
-        username: str,
+        database: Optional[str] = None,
+        username: Optional[str] = None,
         password: Optional[str] = None,
         host: str = "localhost",
         port: int = 3306,
+        dialect: Literal["mysql", "sqlite"] = "mysql",
+        storage: Optional[str] = None,
+        mode: Optional[str] = None,
     ):
         self.database = database
         self.username = username
         self.password = password
         self.host = host
         self.port = port
+        self.dialect = dialect
+        self.storage = ":memory:" if storage is None else str(storage)
+        self.mode = mode
+        self._sqlite_connection = None
         self.engine = self._create_engine()
 
     def query_to_dataframe(self, query: str) -> Optional[pd.DataFrame]:
@@ -102,32 +188,27 @@ class MySQLDatabase:
             except KeyError:
                 results = pd.read_sql_query(query, self.engine)
             return results
-        except mysql.connector.Error as error:
+        except DATABASE_ERRORS as error:
             logging.error(f"Error querying MySQL database: {error}")
 
-    def query(self, query: str):
+    def query(self, query: str, parameters: Optional[Sequence] = None):
         """Executes a query and returns the results as a list of tuples."""
         connection = None
         cursor = None
         try:
             # Connect to the database
-            connection = mysql.connector.connect(
-                user=self.username,
-                password=self.password,
-                database=self.database,
-                host=self.host,
-            )
+            connection = self._connect()
             cursor = connection.cursor()
-            cursor.execute(query)
+            cursor.execute(query, parameters or ())
             results = cursor.fetchall()
 
-        except mysql.connector.Error as error:
+        except DATABASE_ERRORS as error:
             logging.error(f"Error querying MySQL database: {error}")
             results = None
 
         finally:
             self._close_cursor(cursor)
-            self._close_connection
+            self._close_connection(connection)
 
         return results
 
@@ -154,7 +235,7 @@ class MySQLDatabase:
             column_names = ""
 
         # Create the insert query
-        placeholders = ", ".join(["%s"] * num_columns)
+        placeholders = ", ".join([self.placeholder] * num_columns)
         insert_query = (
             f"INSERT INTO {table} "
             + (f"({column_names})" if column_names else "")
@@ -164,18 +245,13 @@ class MySQLDatabase:
         connection = None
         cursor = None
         try:
-            connection = mysql.connector.connect(
-                user=self.username,
-                password=self.password,
-                database=self.database,
-                host=self.host,
-            )
+            connection = self._connect()
             cursor = connection.cursor()
             cursor.execute(insert_query, record)
             connection.commit()
             logging.info(f"Inserted record into {table}.")
             success = True
-        except mysql.connector.Error as error:
+        except DATABASE_ERRORS as error:
             logging.error(f"Error inserting record into {table}: {error}")
             success = False
         finally:
@@ -185,9 +261,21 @@ class MySQLDatabase:
         return success
 
     def insert_records(
-        self, table: str, records: List[Tuple], columns: Optional[List[str]] = None
+        self,
+        table: str,
+        records: List[Tuple],
+        columns: Optional[List[str]] = None,
+        on_duplicate: Optional[Literal["ignore", "update"]] = None,
     ):
-        """Inserts multiple records into a specified table with optional columns."""
+        """
+        Inserts multiple records into a specified table with optional columns.
+
+        With on_duplicate set, rows colliding with an existing primary or unique key
+        are either skipped ("ignore") or overwritten with the new values ("update"),
+        which makes repeated inserts of the same records a no-op. Unlike INSERT
+        IGNORE, "ignore" only skips key collisions, other errors still fail.
+        Returns True if the records were committed.
+        """
         if not records:
             logging.warning("No records to insert.")
             return
@@ -205,28 +293,70 @@ class MySQLDatabase:
             column_names = ""
 
         # Create the insert query
-        placeholders = ", ".join(["%s"] * num_columns)
+        placeholders = ", ".join([self.placeholder] * num_columns)
         insert_query = (
             f"INSERT INTO {table} "
             + (f"({column_names})" if column_names else "")
             + f"VALUES ({placeholders})"
         )
+        if on_duplicate is not None and not columns:
+            logging.error("Columns are required to handle duplicate records.")
+            return False
+        if on_duplicate == "ignore":
+            if self.dialect == "sqlite":
+                insert_query += " ON CONFLICT DO NOTHING"
+            else:
+                # No-op update, which unlike INSERT IGNORE keeps other errors
+                insert_query += f" ON DUPLICATE KEY UPDATE {columns[0]} = {columns[0]}"
+        if on_duplicate == "update":
+            if self.dialect == "sqlite":
+                insert_query += " ON CONFLICT DO UPDATE SET " + ", ".join(
+                    f"{column} = excluded.{column}" for column in columns
+                )
+            else:
+                insert_query += " ON DUPLICATE KEY UPDATE " + ", ".join(
+                    f"{column} = VALUES({column})" for column in columns
+                )
 
         connection = None
         cursor = None
         try:
-            connection = mysql.connector.connect(
-                user=self.username,
-                password=self.password,
-                database=self.database,
-                host=self.host,
-            )
+            connection = self._connect()
             cursor = connection.cursor()
             cursor.executemany(insert_query, records)
             connection.commit()
             logging.info(f"Inserted {len(records)} records into {table}.")
-        except mysql.connector.Error as error:
+            success = True
+        except DATABASE_ERRORS as error:
             logging.error(f"Error inserting records into {table}: {error}")
+            success = False
+        finally:
+            self._close_cursor(cursor)
+            self._close_connection(connection)
+
+        return success
+
+    def execute(self, statements: List[Tuple[str, Optional[Sequence]]]) -> List[int]:
+        """
+        Executes (statement, parameters) pairs in a single transaction and returns
+        the number of affected rows of each. The transaction is rolled back and the
+        error raised if a statement fails.
+        """
+        connection = None
+        cursor = None
+        try:
+            connection = self._connect()
+            cursor = connection.cursor()
+            rowcounts = []
+            for statement, parameters in statements:
+                cursor.execute(statement, parameters or ())
+                rowcounts.append(cursor.rowcount)
+            connection.commit()
+            return rowcounts
+        except DATABASE_ERRORS:
+            if connection is not None:
+                connection.rollback()
+            raise
         finally:
             self._close_cursor(cursor)
             self._close_connection(connection)
@@ -237,13 +367,56 @@ class MySQLDatabase:
         # Sort numerically
         return sorted([row[0] for row in results]) if results else []
 
+    def _connect(self):
+        """
+        Opens a connection to the database. SQLite uses a single connection for the
+        lifetime of the instance, as every new connection to :memory: would see a
+        new, empty database.
+        """
+        if self.dialect == "sqlite":
+            if self._sqlite_connection is None:
+                self._sqlite_connection = sqlite3.connect(
+                    self.storage,
+                    detect_types=sqlite3.PARSE_DECLTYPES,
+                    check_same_thread=False,
+                )
+                for pragma in SQLITE_PRAGMAS:
+                    self._sqlite_connection.execute(pragma)
+            return self._sqlite_connection
+
+        return mysql.connector.connect(
+            user=self.username,
+            password=self.password,
+            database=self.database,
+            host=self.host,
+        )
+
+    @property
+    def identity(self) -> str:
+        """Identifies the database, e.g. for local state kept about its contents."""
+        if self.dialect == "sqlite":
+            location = f"sqlite:{self.storage}"
+        else:
+            location = f"mysql://{self.host}:{self.port}/{self.database}"
+        return f"{location} ({self.mode})" if self.mode else location
+
+    @property
+    def placeholder(self) -> str:
+        """Parameter placeholder of the database driver."""
+        return "?" if self.dialect == "sqlite" else "%s"
+
     def _create_engine(self) -> Engine:
-        """Constructs the SQLAlchemy engine for MySQL."""
+        """Constructs the SQLAlchemy engine for MySQL or SQLite."""
         url = self._create_url()
+        if self.dialect == "sqlite":
+            # Share the connection used by the other methods
+            return create_engine(url, creator=self._connect, poolclass=StaticPool)
         return create_engine(url)
 
     def _create_url(self) -> str:
-        """Constructs the SQLAlchemy URL for MySQL."""
+        """Constructs the SQLAlchemy URL for MySQL or SQLite."""
+        if self.dialect == "sqlite":
+            return "sqlite://"
         url = (
             f"mysql+mysqlconnector://{self.username}"
             + (f":{self.password}" if self.password else "")
@@ -251,8 +424,17 @@ class MySQLDatabase:
         )
         return url
 
-    def reset(self):
-        """Resets the database by dropping and recreating all tables."""
+    def reset(self, mode: Literal["recreate", "truncate"] = "recreate"):
+        """
+        Resets the database. By default, all tables are dropped and recreated from
+        migrations/database_structure.sql. With mode="truncate", only the data tables
+        are emptied, which is much faster and keeps the schema as is.
+        """
+        if mode == "truncate":
+            return self.truncate()
+        if self.dialect == "sqlite":
+            return self._reset_sqlite()
+
         try:
             connection = mysql.connector.connect(
                 user=self.username,
@@ -290,6 +472,204 @@ class MySQLDatabase:
             self._close_cursor(cursor)
             self._close_connection(connection)
 
+    def _reset_sqlite(self):
+        """Drops all tables and recreates them from the SQLite structure file."""
+        database_structure_path = (
+            PROJECT_BASE / "migrations" / "database_structure_sqlite.sql"
+        )
+        if not database_structure_path.exists():
+            raise FileNotFoundError(f"SQL file not found: {database_structure_path}")
+
+        connection = self._connect()
+        tables = connection.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        connection.execute("PRAGMA foreign_keys=OFF")
+        for (table,) in tables:
+            connection.execute(f"DROP TABLE IF EXISTS `{table}`")
+        with open(database_structure_path, "r") as file:
+            connection.executescript(file.read())
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.commit()
+        logging.info("Database reset and structure recreated.")
+
+    def has_table(self, table: str) -> bool:
+        """Whether the table exists."""
+        return inspect(self.engine).has_table(table)
+
+    def data_tables(self) -> List[str]:
+        """
+        The DATA_TABLES that exist. Databases created before a table was added to the
+        schema lack it until `migrate` is run.
+        """
+        return [table for table in DATA_TABLES if self.has_table(table)]
+
+    def all_posts(self) -> str:
+        """
+        FROM clause of all posts, including the ones moved to posts_archive by
+        maintenance.py, for analyses that need the full history of classifications.
+        """
+        return ALL_POSTS if self.has_table("posts_archive") else "posts"
+
+    def create_posts_archive(self):
+        """Creates the posts_archive table if it does not exist yet."""
+        self.execute([(POSTS_ARCHIVE_DDL[self.dialect], None)])
+
+    def _has_unique_key(self, table: str, columns: List[str]) -> bool:
+        inspector = inspect(self.engine)
+        keys = inspector.get_unique_constraints(table) + [
+            index for index in inspector.get_indexes(table) if index["unique"]
+        ]
+        return any(sorted(key["column_names"]) == sorted(columns) for key in keys)
+
+    def migrate(self):
+        """
+        Brings a database created with an older schema up to date without touching
+        its data: creates posts_archive and adds the unique (user_id, view_order)
+        key to UserViews that makes re-running the view setup a no-op. Running it
+        again does nothing.
+        """
+        if not self.has_table("posts_archive"):
+            self.create_posts_archive()
+            logging.info("Created posts_archive.")
+
+        if not self._has_unique_key("UserViews", ["user_id", "view_order"]):
+            results = self.query(
+                "SELECT COUNT(*) FROM (SELECT user_id, view_order FROM UserViews "
+                "GROUP BY user_id, view_order HAVING COUNT(*) > 1) AS duplicates"
+            )
+            if results is None:
+                raise ValueError("Error checking UserViews for duplicates.")
+            if results[0][0]:
+                raise ValueError(
+                    f"UserViews has {results[0][0]} duplicate (user_id, view_order) "
+                    "entries, remove them before adding the unique key."
+                )
+            self.execute([(USER_VIEW_ORDER_KEY_DDL[self.dialect], None)])
+            logging.info("Added the unique (user_id, view_order) key to UserViews.")
+
+    def truncate(self, tables: Optional[List[str]] = None):
+        """Empties the given tables (all data tables by default) in dependency order."""
+        tables = self.data_tables() if tables is None else tables
+        self._execute_statements(
+            [
+                statement
+                for table in tables
+                for statement in self._truncate_statements(table)
+            ],
+            f"Truncated {', '.join(tables)}.",
+        )
+
+    def _truncate_statements(self, table: str) -> List[str]:
+        """SQLite has no TRUNCATE, delete all rows and reset the id counter instead."""
+        if self.dialect == "sqlite":
+            return [
+                f"DELETE FROM {table}",
+                f"DELETE FROM sqlite_sequence WHERE name = '{table}'",
+            ]
+        return [f"TRUNCATE TABLE {table}"]
+
+    def snapshot(self, name: str = "baseline", tables: Optional[List[str]] = None):
+        """
+        Saves the current content of the data tables to template tables within the
+        same database, so that it can be restored quickly with `restore`.
+        """
+        tables = self.data_tables() if tables is None else tables
+        statements = []
+        for table in tables:
+            snapshot_table = self._snapshot_table(name, table)
+            statements.append(f"DROP TABLE IF EXISTS {snapshot_table}")
+            if self.dialect == "sqlite":
+                statements.append(
+                    f"CREATE TABLE {snapshot_table} AS SELECT * FROM {table}"
+                )
+            else:
+                statements += [
+                    f"CREATE TABLE {snapshot_table} LIKE {table}",
+                    f"INSERT INTO {snapshot_table} SELECT * FROM {table}",
+                ]
+        self._execute_statements(statements, f"Saved snapshot {name}.")
+
+    def restore(self, name: str = "baseline", tables: Optional[List[str]] = None):
+        """
+        Restores the data tables from a snapshot taken with `snapshot`. Raises a
+        ValueError, leaving the tables untouched, if the snapshot lacks any of them,
+        as MySQL commits a TRUNCATE immediately and it cannot be rolled back.
+        """
+        tables = self.data_tables() if tables is None else tables
+        missing = [
+            table
+            for table in tables
+            if not self.has_table(self._snapshot_table(name, table))
+        ]
+        if missing:
+            raise ValueError(f"Snapshot {name} has no copy of {', '.join(missing)}.")
+        statements = [
+            statement
+            for table in tables
+            for statement in self._truncate_statements(table)
+        ]
+        # Insert parents before the tables referencing them
+        statements += [
+            f"INSERT INTO {table} SELECT * FROM {self._snapshot_table(name, table)}"
+            for table in reversed(tables)
+        ]
+        self._execute_statements(statements, f"Restored snapshot {name}.")
+
+    def drop_snapshot(self, name: str = "baseline", tables: Optional[List[str]] = None):
+        """Drops the template tables of a snapshot."""
+        tables = self.data_tables() if tables is None else tables
+        self._execute_statements(
+            [
+                f"DROP TABLE IF EXISTS {self._snapshot_table(name, table)}"
+                for table in tables
+            ],
+            f"Dropped snapshot {name}.",
+        )
+
+    @staticmethod
+    def _snapshot_table(name: str, table: str) -> str:
+        return f"_snapshot_{name}_{table}"
+
+    def _execute_statements(self, statements: List[str], message: str):
+        """
+        Executes statements on one connection with foreign key checks disabled. The
+        checks are enabled again even if a statement fails, as SQLite shares its
+        connection with every later call.
+        """
+        if self.dialect == "sqlite":
+            disable_checks, enable_checks = (
+                "PRAGMA foreign_keys=OFF",
+                "PRAGMA foreign_keys=ON",
+            )
+        else:
+            disable_checks, enable_checks = (
+                "SET FOREIGN_KEY_CHECKS=0",
+                "SET FOREIGN_KEY_CHECKS=1",
+            )
+
+        connection = None
+        cursor = None
+        try:
+            connection = self._connect()
+            cursor = connection.cursor()
+            cursor.execute(disable_checks)
+            for statement in statements:
+                cursor.execute(statement)
+            connection.commit()
+            logging.info(message)
+        except DATABASE_ERRORS as error:
+            logging.error(f"Error executing statements: {error}")
+            if connection is not None:
+                connection.rollback()
+            raise
+        finally:
+            if cursor is not None:
+                cursor.execute(enable_checks)
+            self._close_cursor(cursor)
+            self._close_connection(connection)
+
     @staticmethod
     def _close_cursor(cursor):
         """Closes a cursor."""
@@ -299,10 +679,9 @@ class MySQLDatabase:
             except Exception:
                 print("Error closing cursor")
 
-    @staticmethod
-    def _close_connection(connection):
-        """Closes a connection."""
-        if connection:
+    def _close_connection(self, connection):
+        """Closes a connection, keeping the shared SQLite connection open."""
+        if connection and connection is not self._sqlite_connection:
             try:
                 connection.close()
             except Exception:
@@ -319,10 +698,24 @@ class MySQLDatabase:
         if not config_loader.config:
             raise ValueError("ConfigLoader config is empty")
 
+        storage = config_loader.get("storage")
+        if storage is not None and storage != ":memory:":
+            # Relative storage paths are relative to the project, as for the server
+            storage = str(PROJECT_BASE / storage)
+
         return cls(
+            storage=storage,
+            mode=mode,
             **{
                 item: config_loader.get(item)
-                for item in ["database", "username", "password", "host", "port"]
+                for item in [
+                    "database",
+                    "username",
+                    "password",
+                    "host",
+                    "port",
+                    "dialect",
+                ]
                 if item in config_loader.config
-            }
+            },
         )
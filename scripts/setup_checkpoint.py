@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Iterator, List, Literal, Optional, Tuple
+
+from mysql_database import MySQLDatabase
+
+CHECKPOINT_DIR = Path(__file__).parent / "output" / "checkpoints"
+
+
+class SetupCheckpoint:
+    """
+    SetupCheckpoint persists the progress of a chunked setup job in a local JSON file,
+    so that an interrupted job can be resumed from the last committed chunk.
+
+    The checkpoint stores the job parameters, which must include everything the
+    records and their split into chunks depend on (e.g. the random seed and the
+    chunk size). Resuming with different parameters raises an error, as the
+    already committed chunks would not match the newly generated ones.
+
+    Checkpoints are kept per database (see MySQLDatabase.identity), and resuming
+    checks that the table still holds at least the rows of the committed chunks,
+    so a checkpoint never skips chunks on another or a reset database. The
+    checkpoint is removed once the job completes.
+
+    Attributes
+    ----------
+    path : Path
+        Location of the checkpoint file.
+    job : str
+        Name of the setup job, e.g. "users" or "views".
+    parameters : dict
+        JSON serializable parameters the job was started with.
+    database : str
+        Identity of the database the job writes to.
+    last_committed_chunk : int
+        Index of the last chunk that was committed, -1 if none.
+    committed_rows : int
+        Number of records in the committed chunks.
+
+    Examples
+    --------
+    >>> checkpoint = SetupCheckpoint.load_or_create(
+    ...     "views",
+    ...     parameters={"n_images": 20, "n_views": 5, "seed": 42, "chunk_size": 50},
+    ...     db=db,
+    ...     table="UserViews",
+    ... )
+    >>> insert_in_chunks(
+    ...     db,
+    ...     "UserViews",
+    ...     len(records),
+    ...     lambda chunk: records[chunk],
+    ...     columns=["user_id", "file_id", "view_order"],
+    ...     chunk_size=50,
+    ...     checkpoint=checkpoint,
+    ... )
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        job: str,
+        parameters: dict,
+        database: str,
+        last_committed_chunk: int = -1,
+        committed_rows: int = 0,
+    ):
+        self.path = Path(path)
+        self.job = job
+        self.parameters = parameters
+        self.database = database
+        self.last_committed_chunk = last_committed_chunk
+        self.committed_rows = committed_rows
+
+    def is_committed(self, chunk_index: int) -> bool:
+        """Whether the chunk with the given index was already committed."""
+        return chunk_index <= self.last_committed_chunk
+
+    def mark_committed(self, chunk_index: int, committed_rows: int):
+        """Records a committed chunk and persists the checkpoint."""
+        self.last_committed_chunk = chunk_index
+        self.committed_rows = committed_rows
+        self.save()
+
+    def save(self):
+        """Writes the checkpoint atomically to its path."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "job": self.job,
+                    "parameters": self.parameters,
+                    "database": self.database,
+                    "last_committed_chunk": self.last_committed_chunk,
+                    "committed_rows": self.committed_rows,
+                },
+                file,
+                indent=2,
+            )
+        tmp_path.replace(self.path)
+
+    def remove(self):
+        """Deletes the checkpoint once the job completed."""
+        self.path.unlink(missing_ok=True)
+
+    @staticmethod
+    def default_path(job: str, database: str) -> Path:
+        digest = hashlib.sha256(database.encode()).hexdigest()[:12]
+        return CHECKPOINT_DIR / f"{job}_{digest}.json"
+
+    @classmethod
+    def load_or_create(
+        cls,
+        job: str,
+        parameters: dict,
+        db: MySQLDatabase,
+        table: str,
+        path: Optional[Path] = None,
+    ) -> "SetupCheckpoint":
+        """
+        Loads the checkpoint of a job on db if it exists, otherwise creates a new one.
+        Raises a ValueError if the parameters differ or table lost committed rows.
+        """
+        database = db.identity
+        path = cls.default_path(job, database) if path is None else Path(path)
+        if not path.exists():
+            checkpoint = cls(path, job, parameters, database)
+            checkpoint.save()
+            return checkpoint
+
+        with open(path, "r") as file:
+            state = json.load(file)
+
+        if (
+            state["job"] != job
+            or state["parameters"] != parameters
+            or state["database"] != database
+        ):
+            raise ValueError(
+                f"Checkpoint {path} was created for job {state['job']} on "
+                f"{state['database']} with parameters {state['parameters']}, not "
+                f"{job} on {database} with {parameters}. "
+                "Delete the checkpoint to start a new setup."
+            )
+
+        results = db.query(f"SELECT COUNT(*) FROM {table}")
+        n_rows = results[0][0] if results else 0
+        if n_rows < state["committed_rows"]:
+            raise ValueError(
+                f"Checkpoint {path} recorded {state['committed_rows']} committed rows "
+                f"in {table}, but it holds {n_rows}. The database was reset since. "
+                "Delete the checkpoint to start a new setup."
+            )
+
+        logging.info(
+            f"Resuming {job} from checkpoint {path} after chunk "
+            f"{state['last_committed_chunk']}."
+        )
+        return cls(
+            path,
+            job,
+            parameters,
+            database,
+            last_committed_chunk=state["last_committed_chunk"],
+            committed_rows=state["committed_rows"],
+        )
+
+
+def iter_chunks(n_records: int, chunk_size: int) -> Iterator[Tuple[int, slice]]:
+    """Yields the index and slice of every chunk of n_records records."""
+    for chunk_index, start in enumerate(range(0, n_records, chunk_size)):
+        yield chunk_index, slice(start, min(start + chunk_size, n_records))
+
+
+def insert_in_chunks(
+    db: MySQLDatabase,
+    table: str,
+    n_records: int,
+    get_records: Callable[[slice], List[Tuple]],
+    columns: List[str],
+    chunk_size: int = 10000,
+    checkpoint: Optional[SetupCheckpoint] = None,
+    on_duplicate: Literal["ignore", "update"] = "ignore",
+):
+    """
+    Inserts records into a table in numbered chunks, each committed separately.
+
+    get_records returns the records of a chunk given its slice, so records are only
+    materialized for the chunks that still need to be inserted. Chunks already
+    recorded in the checkpoint are skipped, and rows that collide with existing
+    ones (e.g. committed without being recorded) are skipped as well by default,
+    so re-running an interrupted or finished job neither duplicates nor modifies
+    existing rows. The checkpoint is removed once all chunks are committed.
+    """
+    n_chunks = -(-n_records // chunk_size)
+    for chunk_index, chunk in iter_chunks(n_records, chunk_size):
+        if checkpoint is not None and checkpoint.is_committed(chunk_index):
+            continue
+
+        success = db.insert_records(
+            table, get_records(chunk), columns=columns, on_duplicate=on_duplicate
+        )
+        if not success:
+            raise RuntimeError(
+                f"Inserting chunk {chunk_index + 1}/{n_chunks} into {table} failed. "
+                "Rerun the setup to resume from the last committed chunk."
+            )
+
+        logging.info(f"Committed chunk {chunk_index + 1}/{n_chunks} into {table}.")
+        if checkpoint is not None:
+            checkpoint.mark_committed(chunk_index, chunk.stop)
+
+    if checkpoint is not None:
+        checkpoint.remove()
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from async_api_client import APIClient
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class TimedAPIClient(APIClient):
+    """APIClient that records the latency of every request in a shared list."""
+
+    def __init__(
+        self, username, password, samples: list, base_url="http://localhost:8000/"
+    ):
+        super().__init__(username, password, base_url=base_url)
+        self.samples = samples
+
+    async def _timed(self, endpoint, request):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = await request
+            ok = True
+            return result
+        finally:
+            self.samples.append(
+                (time.time(), endpoint, time.perf_counter() - start, ok)
+            )
+
+    async def fetch_data(self, token=None):
+        return await self._timed("get_data", super().fetch_data(token))
+
+    async def post_data(self, request_data):
+        return await self._timed("post", super().post_data(request_data))
+
+
+def mann_whitney_p_value(first: np.ndarray, later: np.ndarray) -> float:
+    """
+    One-sided p-value that later latencies are stochastically larger than first,
+    using the normal approximation of the Mann-Whitney U statistic.
+    """
+    n1, n2 = len(first), len(later)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    ranks = pd.Series(np.concatenate([first, later])).rank().to_numpy()
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2
+    mean = n1 * n2 / 2
+    std = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    return 0.5 * math.erfc((u - mean) / std / math.sqrt(2))
+
+
+def poll_database_metrics(db: MySQLDatabase) -> dict:
+    """Row counts of the growing tables and the number of open connections."""
+    metrics = {}
+    for table in ["sessions", "posts", "users"]:
+        results = db.query(f"SELECT COUNT(*) FROM {table}")
+        metrics[f"{table}_rows"] = results[0][0] if results else None
+    results = db.query("SHOW STATUS LIKE 'Threads_connected'")
+    metrics["connections"] = int(results[0][1]) if results else None
+    return metrics
+
+
+def summarize_window(samples: pd.DataFrame) -> dict:
+    """Latency percentiles in milliseconds and error counts of one window."""
+    ok = samples["ok"].astype(bool)
+    latencies = samples.loc[ok, "latency"].to_numpy(dtype=np.float64) * 1000
+    summary = {"requests": len(samples), "errors": int((~ok).sum())}
+    for percentile in [50, 90, 99]:
+        summary[f"p{percentile}_ms"] = (
+            float(np.percentile(latencies, percentile)) if len(latencies) else None
+        )
+    return summary
+
+
+def detect_drift(
+    samples: pd.DataFrame,
+    windows: pd.DataFrame,
+    alpha: float = 0.01,
+    min_ratio: float = 1.2,
+) -> List[dict]:
+    """
+    Flags windows whose latencies are significantly larger than in the first window
+    (one-sided Mann-Whitney test at level alpha, Bonferroni corrected) and whose p90
+    grew by at least min_ratio, as well as steadily growing database metrics.
+    """
+    flags = []
+    ok = samples[samples["ok"]]
+    first = ok.loc[ok["window"] == 0, "latency"].to_numpy()
+    later_windows = windows.index[windows.index > 0]
+    corrected_alpha = alpha / max(len(later_windows), 1)
+
+    for window in later_windows:
+        later = ok.loc[ok["window"] == window, "latency"].to_numpy()
+        if len(first) == 0 or len(later) == 0:
+            continue
+        p_value = mann_whitney_p_value(first, later)
+        ratio = np.percentile(later, 90) / np.percentile(first, 90)
+        if p_value < corrected_alpha and ratio >= min_ratio:
+            flags.append(
+                {
+                    "window": int(window),
+                    "metric": "latency_p90",
+                    "ratio": float(ratio),
+                    "p_value": p_value,
+                }
+            )
+
+    for metric in ["sessions_rows", "connections"]:
+        if metric not in windows:
+            continue
+        values = windows[metric].dropna().to_numpy(dtype=np.float64)
+        if len(values) >= 3 and np.all(np.diff(values) > 0):
+            hours = (windows["end"].iloc[-1] - windows["start"].iloc[0]) / 3600
+            flags.append(
+                {
+                    "metric": metric,
+                    "growth": float(values[-1] - values[0]),
+                    "growth_per_hour": float((values[-1] - values[0]) / hours),
+                }
+            )
+
+    return flags
+
+
+async def run_client(client: TimedAPIClient, speed: float, stop_time: float):
+    """Classifies at a steady pace until stop_time, recovering from failed requests."""
+    await client.login()
+    data_response = await client.fetch_data()
+    while time.time() < stop_time:
+        await asyncio.sleep(speed * random.uniform(0.5, 1.5))
+        try:
+            data_response = await client.post_and_fetch_data(
+                {
+                    "certainty": 3,
+                    "file_id_user": int(data_response.headers.get("file_id", 1)),
+                    "time": [0.0],
+                    "view_index_user": int(data_response.headers.get("view_index", 1)),
+                }
+            )
+        except Exception as error:
+            logging.warning(f"{client.username}: request failed: {error}")
+            await asyncio.sleep(speed)
+            try:
+                data_response = await client.fetch_data()
+            except Exception:
+                pass
+
+
+async def sample_windows(
+    samples: list,
+    db: Optional[MySQLDatabase],
+    window_seconds: float,
+    stop_time: float,
+    report_path: Path,
+) -> List[dict]:
+    """Summarizes each window as it completes and appends it to the report."""
+    windows = []
+    n_consumed = 0
+    start = time.time()
+    while start < stop_time:
+        await asyncio.sleep(
+            max(0.0, min(start + window_seconds, stop_time) - time.time())
+        )
+        end = time.time()
+        # Samples are appended on completion, so they arrive in timestamp order
+        window_samples = pd.DataFrame(
+            samples[n_consumed:],
+            columns=["timestamp", "endpoint", "latency", "ok"],
+        )
+        n_consumed += len(window_samples)
+        window = {"window": len(windows), "start": start, "end": end}
+        window.update(summarize_window(window_samples))
+        if db is not None:
+            window.update(await asyncio.to_thread(poll_database_metrics, db))
+        windows.append(window)
+
+        with open(report_path, "a") as file:
+            file.write(json.dumps(window) + "\n")
+        logging.info(
+            f"Window {window['window']}: {window['requests']} requests, "
+            f"p50 {window['p50_ms'] or float('nan'):.1f} ms, "
+            f"p99 {window['p99_ms'] or float('nan'):.1f} ms, "
+            f"{window['errors']} errors."
+        )
+        start = end
+    return windows
+
+
+async def main(
+    user_table_path,
+    base_url,
+    duration: float,
+    window_seconds: float,
+    speed: float,
+    db: Optional[MySQLDatabase],
+    output_dir: Path,
+):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report_path = output_dir / "soak_windows.jsonl"
+    report_path.unlink(missing_ok=True)
+
+    users = pd.read_csv(Path(user_table_path))
+    samples = []
+    stop_time = time.time() + duration
+    clients = [
+        TimedAPIClient(row.username, row.password, samples, base_url=base_url)
+        for row in users.itertuples(index=False)
+    ]
+
+    results = await asyncio.gather(
+        sample_windows(samples, db, window_seconds, stop_time, report_path),
+        *[run_client(client, speed, stop_time) for client in clients],
+        return_exceptions=True,
+    )
+    for client, result in zip(clients, results[1:]):
+        if isinstance(result, Exception):
+            logging.error(f"{client.username} stopped early: {result}")
+
+    windows = pd.DataFrame(results[0]).set_index("window")
+    samples = pd.DataFrame(samples, columns=["timestamp", "endpoint", "latency", "ok"])
+    samples["window"] = np.searchsorted(
+        windows["end"].to_numpy(), samples["timestamp"], side="right"
+    )
+    samples = samples[samples["window"] < len(windows)]
+
+    flags = detect_drift(samples, windows)
+    with open(output_dir / "soak_summary.json", "w") as file:
+        json.dump(
+            {"duration": duration, "clients": len(clients), "drift": flags},
+            file,
+            indent=2,
+        )
+
+    for flag in flags:
+        logging.warning(f"Drift detected: {flag}")
+    if not flags:
+        logging.info("No drift detected.")
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python soak_test.py --duration 14400 --window 300 --speed 2 --mode development
+    """
+    from htd import build_parser
+
+    return build_parser("soak-test").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(
+        main(
+            user_table_path=args.user_table_path,
+            base_url=args.base_url,
+            duration=args.duration,
+            window_seconds=args.window,
+            speed=args.speed,
+            db=None if args.no_db else MySQLDatabase.from_config(mode=args.mode),
+            output_dir=Path(args.output_dir),
+        )
+    )
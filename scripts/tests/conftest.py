@@ -0,0 +1,23 @@
+import pytest
+import setup_checkpoint
+from mysql_database import MySQLDatabase
+
+
+def create_database(n_users: int = 0) -> MySQLDatabase:
+    """In-memory SQLite database with the schema and n_users users."""
+    db = MySQLDatabase(dialect="sqlite", storage=":memory:")
+    db.reset()
+    if n_users:
+        db.insert_records(
+            "users",
+            [(f"user{i}", "") for i in range(1, n_users + 1)],
+            columns=["username", "password"],
+        )
+    return db
+
+
+@pytest.fixture
+def checkpoint_dir(tmp_path, monkeypatch):
+    """Keeps the checkpoints of setup jobs out of scripts/output."""
+    monkeypatch.setattr(setup_checkpoint, "CHECKPOINT_DIR", tmp_path / "checkpoints")
+    return tmp_path / "checkpoints"
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import create_database
+from create_user_views import create_user_view_extension, level_view_counts
+from validate_user_views import load_user_views, validate_user_views
+
+
+def insert_views(db, views: dict):
+    """Inserts the given file ids per user id, in order."""
+    db.insert_records(
+        "UserViews",
+        [
+            (user_id, file_id, view_order)
+            for user_id, file_ids in views.items()
+            for view_order, file_id in enumerate(file_ids, start=1)
+        ],
+        columns=["user_id", "file_id", "view_order"],
+    )
+
+
+def test_level_view_counts_respects_max_per_file():
+    view_counts = pd.Series([0, 10, 10], index=[1, 2, 3])
+
+    new_file_ids = level_view_counts(view_counts, 6, max_per_file=2)
+
+    assert np.bincount(new_file_ids, minlength=4)[1:].tolist() == [2, 2, 2]
+
+
+@pytest.mark.parametrize("delay", [None, 2])
+def test_extension_gives_each_file_to_distinct_users(delay):
+    # View counts [5, 5, 5, 3, 3, 3] from five users, three new users
+    db = create_database(n_users=8)
+    insert_views(
+        db,
+        {
+            1: [1, 2, 3, 4, 5, 6],
+            2: [1, 2, 3, 4, 5, 6],
+            3: [1, 2, 3, 4, 5, 6],
+            4: [1, 2, 3],
+            5: [1, 2, 3],
+        },
+    )
+
+    extension = create_user_view_extension(
+        db, n_images=6, n_views=5, views_per_user=4, delay=delay
+    )
+
+    assert set(extension["user_id"]) == {6, 7, 8}
+    report = validate_user_views(extension, n_images=6, delay=delay)
+    assert report["duplicate_views"] == 0
+    assert report["views_per_user_histogram"] == {8 if delay else 4: 3}
+    if delay is not None:
+        assert report["unpaired_views"] == 0
+        assert report["malformed_pairs"] == 0
+    else:
+        db.insert_records(
+            "UserViews",
+            extension.values.tolist(),
+            columns=["user_id", "file_id", "view_order"],
+        )
+        report = validate_user_views(load_user_views(db), n_images=6, n_views=6)
+        assert report["duplicate_views"] == 0
+        assert report["files_below_n_views"] == 0
+        assert report["files_above_n_views"] == 0
+
+
+def test_extension_of_empty_files():
+    db = create_database(n_users=2)
+
+    extension = create_user_view_extension(
+        db, n_images=4, n_views=2, user_ids=[1, 2], views_per_user=4
+    )
+
+    report = validate_user_views(extension, n_images=4, n_views=2)
+    assert report["duplicate_views"] == 0
+    assert report["files_below_n_views"] == 0
+    assert report["sequences_not_starting_at_one"] == 0
@@ -0,0 +1,15 @@
+import pytest
+from generate_light_curves import LightCurveGenerator
+
+
+def test_generate_refuses_to_overwrite_existing_files(tmp_path):
+    (tmp_path / "file_3.csv.zlib").write_bytes(b"served light curve")
+    generator = LightCurveGenerator(n_images=2, output_dir=tmp_path, baseline=2)
+
+    with pytest.raises(FileExistsError):
+        generator.generate(n_workers=1)
+    assert (tmp_path / "file_3.csv.zlib").read_bytes() == b"served light curve"
+
+    ground_truth = generator.generate(n_workers=1, overwrite=True)
+    assert ground_truth["file_id"].tolist() == [3, 4]
+    assert len(list(tmp_path.glob("*.csv.zlib"))) == 8
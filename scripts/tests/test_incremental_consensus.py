@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from incremental_consensus import IncrementalConsensus
+
+
+def make_posts(ids) -> pd.DataFrame:
+    ids = np.asarray(ids)
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "file_id": ids % 4 + 1,
+            "user_id": ids % 3 + 1,
+            "time": 0.5 + ids % 4,
+            "certainty": 3,
+        }
+    )
+
+
+def test_late_committed_posts_below_the_watermark_are_merged_once(tmp_path):
+    full = IncrementalConsensus(n_images=2)
+    full.update(make_posts(range(1, 21)))
+
+    incremental = IncrementalConsensus(n_images=2, overlap=10)
+    # Post 15 commits after posts 16 to 20
+    incremental.update(make_posts([*range(1, 15), *range(16, 21)]))
+    incremental.save(tmp_path / "state.npz")
+    incremental = IncrementalConsensus.load(n_images=2, path=tmp_path / "state.npz")
+    # The overlap re-reads posts 11 to 20
+    incremental.update(make_posts(range(11, 21)))
+
+    assert incremental.watermark == 20
+    pd.testing.assert_frame_equal(
+        incremental.candidates().sort_values("file_id").reset_index(drop=True),
+        full.candidates().sort_values("file_id").reset_index(drop=True),
+    )
+    assert incremental.users["n_posts"].sum() == 20
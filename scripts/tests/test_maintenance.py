@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import consensus
+import traffic_replay
+from conftest import create_database
+from maintenance import PostArchiver
+
+
+def test_archived_posts_are_still_analyzed():
+    db = create_database(n_users=3)
+    db.insert_records(
+        "posts",
+        [
+            (file_id, user_id, 1.0 + file_id, 3, f"2026-01-0{user_id} 10:00:00")
+            for file_id in range(1, 5)
+            for user_id in range(1, 4)
+        ],
+        columns=["file_id", "user_id", "time", "certainty", "createdAt"],
+    )
+    before = consensus.load_posts(db)
+
+    report = PostArchiver(db, before=datetime(2026, 1, 3), pause=0).run()
+
+    assert report["rows"] == 8
+    assert db.query("SELECT COUNT(*) FROM posts")[0][0] == 4
+    after = consensus.load_posts(db)
+    columns = list(after.columns)
+    assert (
+        after.sort_values(columns)
+        .reset_index(drop=True)
+        .equals(before.sort_values(columns).reset_index(drop=True))
+    )
+    assert len(traffic_replay.load_posts(db)) == 12
+
+
+def create_legacy_database():
+    """Database with the schema from before posts_archive and the view order key."""
+    db = create_database(n_users=2)
+    db.execute(
+        [
+            ("DROP TABLE posts_archive", None),
+            ("DROP TABLE UserViews", None),
+            (
+                "CREATE TABLE UserViews (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "user_id INTEGER NOT NULL, file_id INTEGER NOT NULL, "
+                "view_order INTEGER NOT NULL)",
+                None,
+            ),
+        ]
+    )
+    return db
+
+
+def test_migrate_updates_a_legacy_database():
+    db = create_legacy_database()
+    db.insert_records(
+        "posts",
+        [(1, 1, 1.0, 3, "2026-01-01 10:00:00")],
+        columns=["file_id", "user_id", "time", "certainty", "createdAt"],
+    )
+    assert len(consensus.load_posts(db)) == 1
+
+    db.migrate()
+    db.migrate()
+
+    assert db.has_table("posts_archive")
+    assert len(consensus.load_posts(db)) == 1
+    db.insert_records(
+        "UserViews", [(1, 1, 1)], columns=["user_id", "file_id", "view_order"]
+    )
+    assert not db.insert_records(
+        "UserViews", [(1, 2, 1)], columns=["user_id", "file_id", "view_order"]
+    )
+
+
+def test_archiver_creates_the_missing_archive():
+    db = create_legacy_database()
+    db.insert_records(
+        "posts",
+        [(1, 1, 1.0, 3, "2026-01-01 10:00:00")],
+        columns=["file_id", "user_id", "time", "certainty", "createdAt"],
+    )
+
+    report = PostArchiver(db, before=datetime(2026, 1, 3), pause=0).run()
+
+    assert report["rows"] == 1
+    assert db.query("SELECT COUNT(*) FROM posts_archive")[0][0] == 1
@@ -0,0 +1,51 @@
+from conftest import create_database
+from monitor import ProgressMonitor
+
+
+def test_user_cursor_advances_past_a_crowded_second():
+    db = create_database()
+    monitor = ProgressMonitor(db, n_files=10, batch_size=5)
+    db.insert_records(
+        "users",
+        [(f"user{i}", "2026-01-01 10:00:00") for i in range(1, 31)],
+        columns=["username", "updatedAt"],
+    )
+    db.execute(
+        [
+            (
+                "UPDATE users SET view_index = 7, updatedAt = ? WHERE id = 2",
+                ("2026-01-01 10:00:01",),
+            )
+        ]
+    )
+
+    for _ in range(7):
+        monitor.poll()
+
+    assert len(monitor.view_indices) == 30
+    assert monitor.view_indices[2] == 7
+    assert monitor.last_user_id == 2
+
+
+def test_classifications_survive_a_restart():
+    db = create_database(n_users=2)
+    monitor = ProgressMonitor(db, n_files=2)
+    posts = [
+        (1, 1, "2026-01-01 10:00:00"),
+        (1, 1, "2026-01-01 10:05:00"),
+        (2, 1, "2026-01-01 10:06:00"),
+        (1, 2, "2026-01-01 10:07:00"),
+    ]
+
+    for file_id, user_id, created_at in posts:
+        db.insert_records(
+            "posts",
+            [(file_id, user_id, 1.0, 3, created_at)],
+            columns=["file_id", "user_id", "time", "certainty", "createdAt"],
+        )
+        monitor.poll()
+
+    restarted = ProgressMonitor(db, n_files=2)
+    assert monitor.views_per_file.tolist() == [0, 2, 1]
+    assert restarted.views_per_file.tolist() == monitor.views_per_file.tolist()
+    assert restarted.n_classifications == monitor.n_classifications == 3
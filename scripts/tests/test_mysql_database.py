@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+from conftest import create_database
+
+
+def create_database_with_posts():
+    db = create_database(n_users=2)
+    db.insert_records(
+        "posts",
+        [(1, 1, 1.0, 3, "2026-01-01 10:00:00"), (2, 2, 2.0, 4, "2026-01-02 10:00:00")],
+        columns=["file_id", "user_id", "time", "certainty", "createdAt"],
+    )
+    return db
+
+
+def foreign_keys_enabled(db) -> bool:
+    return db.query("PRAGMA foreign_keys")[0][0] == 1
+
+
+def test_restore_returns_to_the_snapshot():
+    db = create_database_with_posts()
+    before = db.query("SELECT * FROM posts ORDER BY id")
+    db.snapshot()
+
+    db.truncate()
+    db.insert_records("users", [("user3", "")], columns=["username", "password"])
+    db.restore()
+
+    assert db.query("SELECT * FROM posts ORDER BY id") == before
+    assert db.query("SELECT username FROM users ORDER BY id") == [
+        ("user1",),
+        ("user2",),
+    ]
+    assert foreign_keys_enabled(db)
+
+
+def test_restore_of_a_missing_snapshot_keeps_the_data():
+    db = create_database_with_posts()
+    db.snapshot(tables=["posts"])
+
+    with pytest.raises(ValueError, match="users"):
+        db.restore()
+
+    assert db.query("SELECT COUNT(*) FROM posts")[0][0] == 2
+    assert db.query("SELECT COUNT(*) FROM users")[0][0] == 2
+    assert foreign_keys_enabled(db)
+
+
+def test_failed_statements_are_rolled_back():
+    db = create_database_with_posts()
+
+    with pytest.raises(sqlite3.Error):
+        db._execute_statements(
+            ["DELETE FROM posts", "DELETE FROM does_not_exist"], "Deleted."
+        )
+
+    assert db.query("SELECT COUNT(*) FROM posts")[0][0] == 2
+    assert foreign_keys_enabled(db)
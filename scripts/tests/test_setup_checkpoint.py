@@ -0,0 +1,120 @@
+import bcrypt
+import pytest
+from conftest import create_database
+from create_user_views import insert_user_image_views
+from user_generation import generate_users
+from validate_user_views import load_user_views
+
+
+def fail_after(db, n_chunks: int):
+    """Makes the inserts of db fail after n_chunks successful ones."""
+    insert_records = db.insert_records
+    calls = {"n": 0}
+
+    def failing_insert_records(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] > n_chunks:
+            return False
+        return insert_records(*args, **kwargs)
+
+    db.insert_records = failing_insert_records
+    return insert_records
+
+
+def interrupted_views_run(db):
+    original = fail_after(db, 2)
+    with pytest.raises(RuntimeError):
+        insert_user_image_views(db, 24, 5, chunk_size=25, resume=True)
+    db.insert_records = original
+    assert len(load_user_views(db)) == 50
+
+
+def test_resume_inserts_the_remaining_chunks(checkpoint_dir):
+    db = create_database(n_users=10)
+    interrupted_views_run(db)
+
+    insert_user_image_views(db, 24, 5, chunk_size=25, resume=True)
+
+    user_views = load_user_views(db)
+    assert len(user_views) == 120
+    assert not user_views.duplicated(["user_id", "view_order"]).any()
+    assert user_views.groupby("file_id")["user_id"].nunique().eq(5).all()
+
+
+@pytest.mark.parametrize("chunk_size", [None, 50])
+def test_resume_rejects_a_different_chunk_size(checkpoint_dir, chunk_size):
+    db = create_database(n_users=10)
+    interrupted_views_run(db)
+
+    with pytest.raises(ValueError, match="Checkpoint"):
+        insert_user_image_views(db, 24, 5, chunk_size=chunk_size, resume=True)
+    assert len(load_user_views(db)) == 50
+
+
+def test_resume_rejects_changed_users(checkpoint_dir):
+    db = create_database(n_users=10)
+    interrupted_views_run(db)
+    db.insert_records("users", [("user11", "")], columns=["username", "password"])
+
+    with pytest.raises(ValueError, match="Checkpoint"):
+        insert_user_image_views(db, 24, 5, chunk_size=25, resume=True)
+
+
+def test_rerun_keeps_existing_views(checkpoint_dir):
+    db = create_database(n_users=10)
+    insert_user_image_views(db, 24, 5, seed=1)
+    before = load_user_views(db).sort_values(["user_id", "view_order"])
+
+    insert_user_image_views(db, 24, 5, seed=2)
+
+    after = load_user_views(db).sort_values(["user_id", "view_order"])
+    assert after.reset_index(drop=True).equals(before.reset_index(drop=True))
+
+
+def test_rerun_keeps_existing_user_passwords(checkpoint_dir):
+    db = create_database()
+    users = generate_users(db, 3, n_workers=1, executor="thread")
+    hashes = db.query("SELECT username, password FROM users ORDER BY id")
+
+    rerun = generate_users(db, 4, n_workers=1, executor="thread")
+
+    assert rerun["username"].tolist() == ["user4"]
+    assert db.query("SELECT username, password FROM users ORDER BY id")[:3] == hashes
+    assert all(
+        bcrypt.checkpw(user.password.encode(), hashed)
+        for user, (_, hashed) in zip(users.itertuples(), hashes)
+    )
+
+
+def test_checkpoints_do_not_carry_over_to_another_database(checkpoint_dir):
+    development, production = create_database(), create_database()
+    generate_users(development, 3, resume=True, n_workers=1, executor="thread")
+    assert not list(checkpoint_dir.glob("*"))
+
+    users = generate_users(production, 3, resume=True, n_workers=1, executor="thread")
+
+    assert len(users) == 3
+    assert production.query("SELECT COUNT(*) FROM users")[0][0] == 3
+
+
+def test_resume_rejects_a_reset_database(checkpoint_dir):
+    db = create_database(n_users=10)
+    interrupted_views_run(db)
+    db.truncate(["UserViews"])
+
+    with pytest.raises(ValueError, match="reset"):
+        insert_user_image_views(db, 24, 5, chunk_size=25, resume=True)
+
+
+def test_ignoring_duplicates_keeps_other_errors():
+    db = create_database(n_users=1)
+
+    assert db.insert_records(
+        "users",
+        [("user1", "")],
+        columns=["username", "password"],
+        on_duplicate="ignore",
+    )
+    assert not db.insert_records(
+        "users", [(None, "")], columns=["username", "password"], on_duplicate="ignore"
+    )
@@ -0,0 +1,25 @@
+import pandas as pd
+from traffic_replay import reconstruct_sessions
+
+
+def test_first_gaps_are_capped_at_max_gap():
+    posts = pd.DataFrame(
+        {
+            "user_id": [1, 1, 2, 3],
+            "file_id": [1, 2, 1, 1],
+            "time": [1.0, 2.0, 3.0, None],
+            "certainty": [3, 2, 1, 3],
+            "createdAt": [
+                "2026-01-01 10:00:00",
+                "2026-01-01 10:00:30",
+                "2026-01-01 10:00:10",
+                "2026-01-03 10:00:00",
+            ],
+        }
+    )
+
+    sessions = reconstruct_sessions(posts, max_gap=60)
+
+    assert sessions[1]["gap"].tolist() == [0.0, 30.0]
+    assert sessions[2]["gap"].tolist() == [10.0]
+    assert sessions[3]["gap"].tolist() == [70.0]
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from async_api_client import APIClient
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def load_posts(
+    db: MySQLDatabase, since: Optional[str] = None, until: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Loads the posts (archived ones included) needed to reconstruct sessions,
+    optionally within a time range.
+    """
+    conditions = []
+    if since is not None:
+        conditions.append(f"createdAt >= '{since}'")
+    if until is not None:
+        conditions.append(f"createdAt < '{until}'")
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+    posts = db.query_to_dataframe(
+        "SELECT user_id, file_id, time, certainty, createdAt "
+        f"FROM {db.all_posts()} {where}"
+    )
+    if posts is None:
+        raise ValueError("Error loading the posts table.")
+    return posts
+
+
+def reconstruct_sessions(posts: pd.DataFrame, max_gap: float = 600.0) -> dict:
+    """
+    Reconstructs the classification sessions of each user from the posts table.
+
+    The server stores one post per marked time (or a single post without time),
+    so posts of the same user, file and creation time form one classification.
+    For each classification, the recorded marked times, the certainty and the gap
+    to the user's previous classification are kept. Gaps longer than max_gap
+    seconds (breaks between sessions) are capped at max_gap. The first gap of each
+    user is the offset of their first post from the earliest recorded post, so
+    arrivals keep their burstiness. Offsets are compressed the same way: the time
+    between two consecutive users' arrivals is capped at max_gap as well.
+
+    Returns a dict mapping user ids to DataFrames with the columns gap, time and
+    certainty, in the order the classifications were made.
+    """
+    posts = posts.assign(createdAt=pd.to_datetime(posts["createdAt"]))
+    classifications = (
+        posts.groupby(["user_id", "createdAt", "file_id"], sort=True)
+        .agg(
+            time=("time", lambda times: times.dropna().tolist()),
+            certainty=("certainty", "first"),
+        )
+        .reset_index()
+    )
+    classifications["certainty"] = classifications["certainty"].fillna(1)
+
+    gaps = classifications.groupby("user_id")["createdAt"].diff().dt.total_seconds()
+    arrivals = classifications.loc[gaps.isna(), "createdAt"].sort_values()
+    arrival_gaps = np.clip(arrivals.diff().dt.total_seconds().fillna(0.0), 0.0, max_gap)
+    offsets = pd.Series(np.nan, index=classifications.index)
+    offsets[arrival_gaps.index] = arrival_gaps.cumsum()
+    classifications["gap"] = np.where(
+        gaps.isna(), offsets, np.clip(gaps.to_numpy(), 0.0, max_gap)
+    )
+
+    sessions = {
+        user_id: steps[["gap", "time", "certainty"]].reset_index(drop=True)
+        for user_id, steps in classifications.groupby("user_id")
+    }
+    if len(classifications) > 0:
+        logging.info(
+            f"Reconstructed {len(classifications)} classifications of "
+            f"{len(sessions)} users (median gap "
+            f"{classifications['gap'].median():.1f}s, "
+            f"{classifications['time'].str.len().mean():.2f} marks per classification)."
+        )
+    return sessions
+
+
+async def main(
+    user_table_path,
+    base_url,
+    sessions: dict,
+    time_factor: float = 1.0,
+):
+    """
+    Replays the recorded sessions with the test accounts in user_table_path.
+    The i-th recorded session is replayed by the i-th test account.
+    """
+    df = pd.read_csv(Path(user_table_path))
+    recorded = list(sessions.values())
+    if len(recorded) > len(df):
+        logging.warning(
+            f"Only {len(df)} test accounts for {len(recorded)} recorded sessions, "
+            "replaying the first ones."
+        )
+
+    tasks = []
+    for (_, row), steps in zip(df.iterrows(), recorded):
+        client = APIClient(row["username"], row["password"], base_url=base_url)
+        tasks.append(client.replay(steps, login=True, time_factor=time_factor))
+
+    await asyncio.gather(*tasks)
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python traffic_replay.py --time_factor 10 --since "2024-08-14 10:00:00"
+    """
+    from htd import build_parser
+
+    return build_parser("replay").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.posts_path is not None:
+        posts = pd.read_csv(args.posts_path, parse_dates=["createdAt"])
+        if args.since is not None:
+            posts = posts[posts["createdAt"] >= pd.Timestamp(args.since)]
+        if args.until is not None:
+            posts = posts[posts["createdAt"] < pd.Timestamp(args.until)]
+    else:
+        posts = load_posts(
+            MySQLDatabase.from_config(mode=args.mode),
+            since=args.since,
+            until=args.until,
+        )
+
+    asyncio.run(
+        main(
+            user_table_path=args.user_table_path,
+            base_url=args.base_url,
+            sessions=reconstruct_sessions(posts, max_gap=args.max_gap),
+            time_factor=args.time_factor,
+        )
+    )
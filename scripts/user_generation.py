@@ -1,13 +1,18 @@
 import logging
-import re
+import os
 import secrets
 import string
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Literal, Optional, Tuple
 
 import bcrypt
 import pandas as pd
 from mysql_database import MySQLDatabase
+from setup_checkpoint import SetupCheckpoint, insert_in_chunks
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,82 +20,255 @@ logging.basicConfig(
 )
 
 
-def check_for_existing_users(db: MySQLDatabase):
+def check_for_existing_users(db: MySQLDatabase) -> pd.DataFrame:
     current_user_table = db.query_to_dataframe("SELECT * FROM users")
     if current_user_table is None:
         raise ValueError("Error loading the users table.")
     elif current_user_table.shape[0] > 0:
         logging.warning(f"Warning: The users table is not empty: {current_user_table}.")
+    return current_user_table
+
+
+def hash_password(password: str, rounds: int = 10) -> bytes:
+    """Hashes a password with bcrypt."""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds))
+
+
+def create_executor(
+    n_workers: Optional[int] = None,
+    executor: Literal["process", "thread"] = "process",
+) -> Executor:
+    """
+    Creates the pool used for hashing. bcrypt releases the GIL while hashing, so a
+    thread pool scales with the number of cores as well and avoids process startup.
+    """
+    n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+    if executor == "thread":
+        return ThreadPoolExecutor(max_workers=n_workers)
+    return ProcessPoolExecutor(max_workers=n_workers)
+
+
+def hash_passwords(
+    passwords: List[str], pool: Executor, n_workers: int
+) -> Iterator[bytes]:
+    """
+    Submits all passwords to the pool and yields the hashes in input order as they
+    complete, so that consumers can insert finished chunks while hashing continues.
+    """
+    batch_size = max(1, min(64, len(passwords) // (4 * n_workers)))
+    return pool.map(hash_password, passwords, chunksize=batch_size)
+
+
+def generate_passwords(num_useres: int, password_length: int = 5) -> pd.DataFrame:
+    """Generate usernames user1, ..., userN with random passwords."""
+    users = [
+        (
+            f"user{i}",
+            "".join(
+                secrets.choice(string.ascii_letters + string.digits)
+                for _ in range(password_length)
+            ),
+        )
+        for i in range(1, num_useres + 1)
+    ]
+    return pd.DataFrame(
+        users, columns=["username", "password"], index=range(1, len(users) + 1)
+    ).rename_axis("id")
 
 
 def generate_users(
     db: MySQLDatabase,
     num_useres: int,
     password_length: int = 5,
+    chunk_size: Optional[int] = None,
+    resume: bool = False,
+    n_workers: Optional[int] = None,
+    executor: Literal["process", "thread"] = "process",
 ) -> pd.DataFrame:
-    """Generate num_useres users with usernames and passwords of length password_length."""
-    check_for_existing_users(db)
-
-    users = []
-    encrypted_users = []
-    for i in range(1, num_useres + 1):
-        username = f"user{i}"
-        password = "".join(
-            secrets.choice(string.ascii_letters + string.digits)
-            for _ in range(password_length)
+    """
+    Generate num_useres users with usernames and passwords of length password_length.
+
+    Passwords are hashed in parallel by n_workers processes (or threads) and the
+    hashed users are streamed into the chunked inserts as they complete.
+
+    Users are committed in chunks of chunk_size (all at once if None). With resume
+    set, the plain passwords are stored next to a local checkpoint before any user is
+    inserted, so that an interrupted run continues after the last committed chunk
+    with the same passwords. Both are deleted once all users are committed.
+
+    Existing users are never modified, so handouts that were already given out keep
+    working. Usernames that already exist when a run starts are left out of the
+    returned users (and thus of the handouts), as their passwords are unknown.
+    """
+    checkpoint = None
+    passwords_path = None
+    if resume:
+        checkpoint = SetupCheckpoint.load_or_create(
+            "users",
+            parameters={
+                "num_users": num_useres,
+                "password_length": password_length,
+                "chunk_size": chunk_size,
+            },
+            db=db,
+            table="users",
         )
-        users.append((username, password))
-        encrypted_users.append(
-            (username, bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=10)))
+        passwords_path = checkpoint.path.with_suffix(".csv")
+
+    if passwords_path is not None and passwords_path.exists():
+        users = pd.read_csv(
+            passwords_path,
+            index_col="id",
+            dtype={"username": str, "password": str},
+            keep_default_na=False,
         )
+    else:
+        existing_users = check_for_existing_users(db)
+        users = generate_passwords(num_useres, password_length)
+        if len(existing_users) > 0:
+            existing = users["username"].isin(existing_users["username"])
+            if existing.any():
+                logging.warning(
+                    f"Skipping {existing.sum()} users that already exist, their "
+                    "passwords are kept."
+                )
+            users = users[~existing]
+        if passwords_path is not None:
+            users.to_csv(passwords_path)
 
-    users = pd.DataFrame(
-        users, columns=["username", "password"], index=range(1, len(users) + 1)
-    ).rename_axis("id")
+    chunk_size = chunk_size or max(len(users), 1)
+    first_pending = 0
+    if checkpoint is not None:
+        first_pending = (checkpoint.last_committed_chunk + 1) * chunk_size
+    pending = users.iloc[first_pending:]
+    n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+
+    with create_executor(n_workers, executor) as pool:
+        hashes = hash_passwords(pending["password"].tolist(), pool, n_workers)
+        start_time = time.perf_counter()
+        n_done = 0
 
-    db.insert_records("users", encrypted_users, columns=["username", "password"])
+        def hash_chunk(chunk: slice) -> list:
+            nonlocal n_done
+            usernames = users["username"].iloc[chunk].tolist()
+            records = list(zip(usernames, islice(hashes, len(usernames))))
+            n_done += len(records)
+            elapsed = time.perf_counter() - start_time
+            logging.info(
+                f"Hashed {n_done}/{len(pending)} passwords "
+                f"({n_done / elapsed:.1f} users/s with {n_workers} {executor} workers)."
+            )
+            return records
+
+        insert_in_chunks(
+            db,
+            "users",
+            len(users),
+            hash_chunk,
+            columns=["username", "password"],
+            chunk_size=chunk_size,
+            checkpoint=checkpoint,
+        )
+    if passwords_path is not None:
+        # The returned users are the only copy of the passwords from now on
+        passwords_path.unlink(missing_ok=True)
     return users
 
 
+def benchmark_hashing(
+    n_passwords: int = 200,
+    worker_counts: Optional[List[int]] = None,
+    executor: Literal["process", "thread"] = "process",
+) -> pd.DataFrame:
+    """Measures the hashing throughput in users/s for different numbers of workers."""
+    if worker_counts is None:
+        worker_counts = [1, 2, 4, os.cpu_count() or 1]
+    passwords = generate_passwords(n_passwords)["password"].tolist()
+
+    results = []
+    for n_workers in sorted(set(worker_counts)):
+        with create_executor(n_workers, executor) as pool:
+            start_time = time.perf_counter()
+            for _ in hash_passwords(passwords, pool, n_workers):
+                pass
+            elapsed = time.perf_counter() - start_time
+        results.append((n_workers, elapsed, n_passwords / elapsed))
+        logging.info(
+            f"{n_workers} {executor} workers: {n_passwords / elapsed:.1f} users/s."
+        )
+
+    return pd.DataFrame(results, columns=["n_workers", "seconds", "users_per_second"])
+
+
 class UserHandoutGenerator:
+    """
+    UserHandoutGenerator renders login handouts for generated users and saves them
+    as RTF files.
+
+    Handouts are rendered lazily in blocks of block_size users using vectorized
+    string operations on the username and password columns, and written to disk
+    incrementally, so that memory usage does not grow with the number of users.
+
+    Attributes
+    ----------
+    users : pd.DataFrame
+        Users with the columns username and password.
+    width : int
+        Width of a handout in characters.
+    output_dir : Path
+        Directory the handouts are saved to.
+    block_size : int
+        Number of users rendered at once.
+    """
+
     def __init__(
-        self, users: pd.DataFrame, width=40, output_dir: Optional[Path] = None
+        self,
+        users: pd.DataFrame,
+        width=40,
+        output_dir: Optional[Path] = None,
+        block_size: int = 1000,
     ):
         self.users = users
         self.width = width
-        self.handouts = self.generate_handouts()
+        self.block_size = block_size
         self.output_dir = Path.cwd() if output_dir is None else output_dir
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
+    @property
+    def handouts(self) -> dict:
+        """Handouts of all users, keyed by file name."""
+        return self.generate_handouts()
+
     def generate_handouts(self) -> dict:
         """Generates handouts for each user."""
-        handouts = {}
-        for _, user_info in self.users.iterrows():
-            filename = f"{user_info['username']}.txt"
-            message = (
-                "=" * self.width
-                + "\n"
-                + "User Information".center(self.width)
-                + "\n"
-                + "=" * self.width
-                + "\n"
-                + f"Username: {user_info['username']}".center(self.width)
-                + "\n"
-                + f"Password: {user_info['password']}".center(self.width)
+        return dict(self.iter_handouts())
+
+    def iter_handouts(self) -> Iterator[Tuple[str, str]]:
+        """Lazily yields the file name and handout of each user."""
+        border = "=" * self.width + "\n"
+        header = border + "User Information".center(self.width) + "\n" + border
+
+        for start in range(0, len(self.users), self.block_size):
+            block = self.users.iloc[start : start + self.block_size]
+            usernames = block["username"].astype(str)
+            messages = (
+                header
+                + ("Username: " + usernames).str.center(self.width)
                 + "\n"
-                + "=" * self.width
+                + ("Password: " + block["password"].astype(str)).str.center(self.width)
                 + "\n"
+                + border
             )
-            handouts[filename] = message
+            yield from zip((usernames + ".txt").tolist(), messages.tolist())
 
-        return handouts
+    def save_handouts_as_rtf(self, font_size=24, bold=True, n_workers: int = 8):
+        """Converts handouts to RTF format and saves them to files concurrently."""
+        header = self._generate_rtf_header(font_size)
 
-    def save_handouts_as_rtf(self, font_size=24, bold=True):
-        """Converts handouts to RTF format and saves them to files."""
-        for filename, message in self.handouts.items():
+        def save_handout(filename: str, message: str):
             rtf_filename = filename.replace(".txt", ".rtf")
             rtf_content = (
-                self._generate_rtf_header(font_size)
+                header
                 + self._apply_bold(self._format_message(message), bold)
                 + "\\par}"
             )
@@ -99,36 +277,43 @@ class UserHandoutGenerator:
             with open(self.output_dir / rtf_filename, "w") as file:
                 file.write(rtf_content)
 
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            # Bound the number of pending writes to keep memory constant
+            pending = deque()
+            for filename, message in self.iter_handouts():
+                pending.append(pool.submit(save_handout, filename, message))
+                if len(pending) >= 4 * n_workers:
+                    pending.popleft().result()
+            for future in pending:
+                future.result()
+
     def save_handouts_in_combined_rtf(
         self,
         font_size=24,
         bold=True,
         rtf_filename="combined_handouts.rtf",
     ):
-        """Converts handouts to RTF format and saves them to a single file."""
+        """Converts handouts to RTF format and writes them incrementally to one file."""
         output_path = self.output_dir / rtf_filename
-        rtf_content = self._generate_rtf_header(font_size)
-
-        # Prepare the content for the RTF file
-        content = []
         separator = "\\line" + "-" * self.width + "\\line" + "\\line" + "\n"
+        page_break = "\\line" + "\\line" + "\\line" + "\n" + "\\page" + "\n"
 
-        for i, (_, message) in enumerate(self.handouts.items()):
-            content.append(self._format_message(message))
+        with open(output_path, "w") as file:
+            file.write(self._generate_rtf_header(font_size))
+            if bold:
+                file.write("\\b ")
 
-            # Add a separator between handouts
-            if (i + 1) % 4 == 0:
-                content.append("\\line" + "\\line" + "\\line")
-                content.append("\\page" + "\n")
-            else:
-                content.append(separator)
+            for i, (_, message) in enumerate(self.iter_handouts()):
+                if i > 0:
+                    file.write("\n")
+                file.write(self._format_message(message) + "\n")
 
-        # Join the content with the separator
-        rtf_content += self._apply_bold("\n".join(content), bold) + "\\par}"
+                # Add a separator between handouts
+                file.write(page_break if (i + 1) % 4 == 0 else separator)
 
-        # Save the RTF file
-        with open(output_path, "w") as file:
-            file.write(rtf_content)
+            if bold:
+                file.write("\\b0")
+            file.write("\\par}")
 
     def _generate_rtf_header(self, font_size: int) -> str:
         """Generates the RTF header."""
@@ -145,7 +330,7 @@ class UserHandoutGenerator:
 
     def _format_message(self, message: str) -> str:
         """Formats the message for RTF by replacing newlines."""
-        return re.sub(r"\n", r"\\line\\n", message)
+        return message.replace("\n", "\\line\\n")
 
     @classmethod
     def populate_users(
@@ -159,41 +344,33 @@ class UserHandoutGenerator:
 
 
 def parse_args():
-    import argparse
+    from htd import build_parser
 
-    parser = argparse.ArgumentParser(description="Generate users and user handouts.")
-    parser.add_argument(
-        "--num_users", type=int, default=10, help="Number of users to generate."
-    )
-    parser.add_argument(
-        "--password_length",
-        type=int,
-        default=5,
-        help="Length of the generated passwords.",
-    )
-    parser.add_argument(
-        "--output_dir",
-        type=str,
-        default=Path(__file__).parent / "output",
-        help="Directory to save handouts.",
-    )
-    parser.add_argument(
-        "--mode",
-        type=str,
-        default="development",
-        help="Config mode (development/production).",
-    )
-    return parser.parse_args()
+    return build_parser("users").parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
+    if args.benchmark_workers:
+        print(
+            benchmark_hashing(
+                worker_counts=args.benchmark_workers, executor=args.executor
+            ).to_string(index=False)
+        )
+        raise SystemExit(0)
+
     db = MySQLDatabase.from_config(mode=args.mode)
     logging.info(
         f"Generating {args.num_users} users with password length {args.password_length}."
     )
     users = generate_users(
-        db=db, num_useres=args.num_users, password_length=args.password_length
+        db=db,
+        num_useres=args.num_users,
+        password_length=args.password_length,
+        chunk_size=args.chunk_size,
+        resume=args.resume,
+        n_workers=args.n_workers,
+        executor=args.executor,
     )
     user_handout_generator = UserHandoutGenerator(
         users=users,
@@ -0,0 +1,186 @@
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from array_utils import segment_starts
+from mysql_database import MySQLDatabase
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+
+def load_user_views(db: MySQLDatabase) -> pd.DataFrame:
+    """Loads the user_id, file_id and view_order columns of the UserViews table."""
+    user_views = db.query_to_dataframe(
+        "SELECT user_id, file_id, view_order FROM UserViews"
+    )
+    if user_views is None:
+        raise ValueError("Error loading the UserViews table.")
+    return user_views
+
+
+def _histogram(values: np.ndarray) -> dict:
+    """Counts the occurrences of each distinct value."""
+    distinct, counts = np.unique(values, return_counts=True)
+    return dict(zip(distinct.tolist(), counts.tolist()))
+
+
+def validate_user_views(
+    user_views: pd.DataFrame,
+    n_images: int,
+    n_views: Optional[int] = None,
+    delay: Optional[int] = None,
+) -> dict:
+    """
+    Checks a user view mapping against the guarantees of
+    `create_user_view_mapping_with_and_without_transits`.
+
+    All checks operate on NumPy arrays using sorting and segment reductions, so
+    that tables with millions of rows are validated within seconds.
+
+    Parameters
+    ----------
+    user_views : pd.DataFrame
+        Mapping with the columns user_id, file_id and view_order, e.g. loaded from
+        the UserViews table or returned by one of the mapping generators.
+    n_images : int
+        Number of images without transits. With delay set, file_id n_images + i is
+        the transit twin of file_id i.
+    n_views : int, optional
+        Expected number of distinct users per file.
+    delay : int, optional
+        Delay used when generating the transit pairs. If given, every view is checked
+        to have its transit twin, and the distances between the two views of the
+        pairs are reported. They depend on the number of users, see
+        `add_transit_pairs`.
+
+    Returns
+    -------
+    dict
+        Number of violations per check together with the underlying histograms.
+    """
+    user_ids = user_views["user_id"].to_numpy(dtype=np.int64)
+    file_ids = user_views["file_id"].to_numpy(dtype=np.int64)
+    view_orders = user_views["view_order"].to_numpy(dtype=np.int64)
+    n_files = 2 * n_images if delay is not None else n_images
+
+    report = {"n_rows": len(user_views), "n_users": len(np.unique(user_ids))}
+
+    # Files outside of the expected id range
+    report["invalid_file_ids"] = int(
+        np.count_nonzero((file_ids < 1) | (file_ids > n_files))
+    )
+
+    # Duplicate views: the same user is shown the same file more than once
+    pair_keys = np.sort(user_ids * (n_files + 1) + np.clip(file_ids, 0, n_files))
+    unique_pairs = pair_keys[segment_starts(pair_keys)]
+    report["duplicate_views"] = len(pair_keys) - len(unique_pairs)
+
+    # Coverage: distinct users per file
+    users_per_file = np.bincount(unique_pairs % (n_files + 1), minlength=n_files + 1)[
+        1:
+    ]
+    report["users_per_file_histogram"] = _histogram(users_per_file)
+    report["unseen_files"] = int(np.count_nonzero(users_per_file == 0))
+    if n_views is not None:
+        report["files_below_n_views"] = int(np.count_nonzero(users_per_file < n_views))
+        report["files_above_n_views"] = int(np.count_nonzero(users_per_file > n_views))
+
+    # Per-user sequences: view_order should run 1, 2, ..., k without gaps
+    order = np.lexsort((view_orders, user_ids))
+    sorted_users = user_ids[order]
+    sorted_view_orders = view_orders[order]
+    starts = segment_starts(sorted_users)
+    steps = np.diff(sorted_view_orders)
+    within_user = ~starts[1:]
+    report["sequences_not_starting_at_one"] = int(
+        np.count_nonzero(sorted_view_orders[starts] != 1)
+    )
+    report["duplicate_view_orders"] = int(np.count_nonzero(within_user & (steps == 0)))
+    report["view_order_gaps"] = int(np.count_nonzero(within_user & (steps > 1)))
+    report["views_per_user_histogram"] = _histogram(
+        np.diff(np.append(np.flatnonzero(starts), len(sorted_users)))
+    )
+
+    if delay is not None:
+        report.update(
+            _validate_transit_pairs(user_ids, file_ids, view_orders, n_images)
+        )
+
+    return report
+
+
+def _validate_transit_pairs(
+    user_ids: np.ndarray,
+    file_ids: np.ndarray,
+    view_orders: np.ndarray,
+    n_images: int,
+) -> dict:
+    """Checks that every user sees file i and n_images + i, reports their distances."""
+    is_transit = file_ids > n_images
+    base_ids = np.where(is_transit, file_ids - n_images, file_ids)
+
+    # Sorting by (user, base file, transit flag) puts each pair on adjacent rows
+    order = np.lexsort((is_transit, base_ids, user_ids))
+    keys = user_ids[order] * (n_images + 1) + base_ids[order]
+    transit = is_transit[order]
+    orders = view_orders[order]
+
+    starts = segment_starts(keys)
+    segment_lengths = np.diff(np.append(np.flatnonzero(starts), len(keys)))
+    first = np.flatnonzero(starts)
+    complete = (
+        (segment_lengths == 2)
+        & ~transit[first]
+        & transit[np.minimum(first + 1, len(keys) - 1)]
+    )
+
+    distances = np.abs(orders[first[complete] + 1] - orders[first[complete]])
+
+    return {
+        "unpaired_views": int(np.count_nonzero(segment_lengths == 1)),
+        "malformed_pairs": int(np.count_nonzero((segment_lengths > 1) & ~complete)),
+        "transit_distance_median": float(np.median(distances))
+        if len(distances)
+        else None,
+        "transit_distance_histogram": _histogram(distances),
+    }
+
+
+def log_report(report: dict):
+    """Logs the validation report, warning about every non-zero violation count."""
+    for key, value in report.items():
+        if isinstance(value, dict):
+            logging.info(f"{key}: {value}")
+        elif key in {"n_rows", "n_users"} or key.startswith("transit_distance_"):
+            logging.info(f"{key}: {value}")
+        elif value:
+            logging.warning(f"{key}: {value}")
+        else:
+            logging.info(f"{key}: {value}")
+
+
+def parse_args():
+    """Parse command line arguments.
+    Example
+    -------
+    >>> python validate_user_views.py --n_images 20 --n_views 10 --delay 3
+    """
+    from htd import build_parser
+
+    return build_parser("validate-views").parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = MySQLDatabase.from_config(mode=args.mode)
+    report = validate_user_views(
+        load_user_views(db),
+        n_images=args.n_images,
+        n_views=args.n_views,
+        delay=args.delay,
+    )
+    log_report(report)
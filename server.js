@@ -14,6 +14,7 @@ const postController = require("./controllers/post_controller");
 const fileController = require("./controllers/file_controller");
 const tutorialFileController = require("./controllers/tutorial_file_controller");
 const authenticate = require("./middleware/authenticate");
+const { requestTiming } = require("./middleware/requestTiming");
 // const profileController = require('./controllers/profile_controller');
 
 // Configure express
@@ -39,6 +40,11 @@ app.use(cookieParser(cookieSecret));
 
 app.use(express.static(path.join(__dirname, "public")));
 
+// Per-request timing lines, used to correlate load test timings with the server
+if (config.requestTiming) {
+  app.use(requestTiming);
+}
+
 // Expose registration toggle to all views
 app.use((req, res, next) => {
   res.locals.registrationEnabled = config.registrationEnabled !== false;
@@ -0,0 +1,81 @@
+const EventEmitter = require("events");
+const { requestTiming, recordQuery } = require("../middleware/requestTiming");
+
+function mockRequest(headers = {}) {
+  return {
+    method: "POST",
+    path: "/post",
+    get: (name) => headers[name.toLowerCase()],
+  };
+}
+
+function mockResponse() {
+  const res = new EventEmitter();
+  const headers = {};
+  res.statusCode = 201;
+  res.setHeader = jest.fn((name, value) => {
+    headers[name.toLowerCase()] = value;
+  });
+  res.getHeader = (name) => headers[name.toLowerCase()];
+  return res;
+}
+
+function loggedTiming(logSpy) {
+  const line = logSpy.mock.calls.map((call) => call[0]).find((message) =>
+    message.startsWith("request_timing ")
+  );
+  return JSON.parse(line.slice("request_timing ".length));
+}
+
+describe("requestTiming middleware", () => {
+  let logSpy;
+
+  beforeEach(() => {
+    logSpy = jest.spyOn(console, "log").mockImplementation(() => {});
+  });
+
+  afterEach(() => {
+    logSpy.mockRestore();
+  });
+
+  test("echoes the X-Request-Id header and logs it on finish", () => {
+    const req = mockRequest({ "x-request-id": "client-1" });
+    const res = mockResponse();
+    const next = jest.fn();
+
+    requestTiming(req, res, next);
+    res.emit("finish");
+
+    expect(next).toHaveBeenCalledTimes(1);
+    expect(res.setHeader).toHaveBeenCalledWith("X-Request-Id", "client-1");
+    const timing = loggedTiming(logSpy);
+    expect(timing.request_id).toBe("client-1");
+    expect(timing.status).toBe(201);
+    expect(timing.total_ms).toBeGreaterThanOrEqual(0);
+  });
+
+  test("generates a request id when the client sends none", () => {
+    const res = mockResponse();
+
+    requestTiming(mockRequest(), res, jest.fn());
+
+    expect(res.getHeader("X-Request-Id")).toEqual(expect.any(String));
+  });
+
+  test("attributes query times recorded during the request to it", async () => {
+    const res = mockResponse();
+
+    requestTiming(mockRequest(), res, async () => {
+      await Promise.resolve();
+      recordQuery("SELECT 1", 2.5);
+      recordQuery("SELECT 2", 1.5);
+      res.emit("finish");
+    });
+    await new Promise((resolve) => setImmediate(resolve));
+    recordQuery("SELECT 3", 10);
+
+    const timing = loggedTiming(logSpy);
+    expect(timing.db_ms).toBe(4);
+    expect(timing.db_queries).toBe(2);
+  });
+});